@@ -1,11 +1,35 @@
-from flask import Flask, render_template, request, send_from_directory, jsonify, session, redirect, url_for
 import os
-from database import DatabaseManager
+import sys
+
+if __name__ == '__main__':
+    # `python app.py` serves the module imported as `app` and leaves multiprocessing an empty
+    # __main__: spawned image pool processes re-import the main script, which would repeat the
+    # startup below (migrations, static builds, background threads) in every one of them
+    import types
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    from app import app
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=True)
+    sys.exit()
+
+from flask import Flask, render_template, request, send_from_directory, jsonify, session, redirect, url_for, g
+from database import DatabaseManager, BOOKING_FIELDS, GALLERY_ORDER_GAP, SlotUnavailable
+from mail_queue import sender_from_env
+from image_pipeline import build_static_derivatives, upload_extension, srcset as build_srcset
+from image_jobs import runner_from_env
+from gallery_storage import store_from_env
+from static_assets import StaticAssets, IMMUTABLE_MAX_AGE, DEFAULT_MAX_AGE
+from compression import compress_response, precompress_static, precompressed_sibling
+from page_cache import PageCache, site_version
+from rate_limit import limiter_from_env
+from instrumentation import instrumentation_from_env, combine_observers
+from metrics import metrics_from_env
+import mimetypes
 from functools import wraps
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from werkzeug.utils import secure_filename
+from werkzeug.formparser import FormDataParser
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Handle PIL/Pillow import compatibility
 try:
@@ -31,11 +55,52 @@ except ImportError:
             def open(*args, **kwargs):
                 raise NotImplementedError("Image processing not available")
 
+import re
 import sqlite3
+import multiprocessing
+import json
+import hmac
+import base64
+from datetime import datetime, timedelta
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'  # Change this for production!
-db = DatabaseManager()
+# Largest request body accepted (bulk photo uploads included), in megabytes
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 200)) * 1024 * 1024
+# Request timing and slow-path logs (INSTRUMENTATION=1); registered first so its
+# after_request hook runs last and the total includes compression
+instrumentation = instrumentation_from_env()
+instrumentation.init_app(app)
+# Prometheus counters summed over all workers (METRICS=1), scraped from /metrics
+metrics = metrics_from_env()
+metrics.init_app(app)
+# Set METRICS_TOKEN to let a scraper read /metrics with "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+db = DatabaseManager(os.environ.get('DATABASE_PATH', 'bolder_electric.db'),
+                     observer=combine_observers(instrumentation.observer(), metrics.observer()))
+# Login attempt buckets shared by all workers on this host
+login_limiter = limiter_from_env()
+# Background threads belong to the serving processes, not to multiprocessing children that
+# import the app through their parent's main script
+SERVING_PROCESS = multiprocessing.current_process().name == 'MainProcess'
+mail_sender = sender_from_env(db)
+# Set MAIL_SENDER_THREAD=0 when a dedicated `python mail_queue.py` process delivers the mail
+MAIL_SENDER_THREAD = os.environ.get('MAIL_SENDER_THREAD', '1') == '1'
+if MAIL_SENDER_THREAD and SERVING_PROCESS:
+    # Deliver mail left pending or retrying by an earlier run without waiting for a new message;
+    # workers forked from a preloaded app start their own sender
+    mail_sender.start()
+    os.register_at_fork(after_in_child=mail_sender.start)
+# Uploaded originals live outside static/, keyed by their SHA-256
+gallery_store = store_from_env(app.static_folder)
+image_runner = runner_from_env(db, gallery_store)
+# Set IMAGE_JOB_THREAD=0 when a dedicated `python image_jobs.py` process resizes uploads
+IMAGE_JOB_THREAD = os.environ.get('IMAGE_JOB_THREAD', '1') == '1'
+if IMAGE_JOB_THREAD and SERVING_PROCESS:
+    # Pick up queued, abandoned and retrying jobs and collect unused blobs without waiting
+    # for an upload; workers forked from a preloaded app start their own dispatcher
+    image_runner.start()
+    os.register_at_fork(after_in_child=image_runner.start)
 
 # Add noindex headers to prevent search engine indexing during development
 @app.after_request
@@ -44,18 +109,86 @@ def add_noindex_headers(response):
         response.headers['X-Robots-Tag'] = 'noindex, nofollow, nosnippet, noarchive, notranslate, noimageindex'
     return response
 
+# gzip/brotli for HTML and JSON, negotiated per request
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
+
+# Responsive derivatives of the bundled site images (a no-op when they're up to date)
+static_image_variants = build_static_derivatives(app.static_folder) if PIL_AVAILABLE else {}
+
+# .br/.gz siblings of static text assets, served instead of compressing per request
+precompress_static(app.static_folder)
+
+# Content-hashed static URLs; plain /static/ names still work with a short max-age
+static_assets = StaticAssets(app.static_folder)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = DEFAULT_MAX_AGE
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    """Make url_for('static', filename=...) return the fingerprinted name"""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = static_assets.url_name(values['filename'])
+
+def send_static(filename, max_age=None):
+    """Send a file from static/, using its precompressed sibling when the client accepts one"""
+    sibling, encoding = precompressed_sibling(app.static_folder, filename, request.accept_encodings)
+    if sibling is None:
+        return send_from_directory(app.static_folder, filename, max_age=max_age)
+    response = send_from_directory(app.static_folder, sibling, max_age=max_age,
+                                   mimetype=mimetypes.guess_type(filename)[0])
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def serve_static(filename):
+    """Serve a static file, caching fingerprinted and content-addressed names forever"""
+    original, immutable = static_assets.resolve(filename)
+    if not immutable:
+        return send_static(original)
+    response = send_static(original, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+app.view_functions['static'] = serve_static
+
+# Public pages rendered once per data generation and shared by all workers via SQLite;
+# templates and static fingerprints are part of the key, so a deploy starts afresh
+page_cache = PageCache(db, site_version(app.template_folder,
+                                        extra=''.join(sorted(static_assets.manifest.values()))))
+
+@app.template_global()
+def static_variants(filename):
+    """Derivative manifest for a bundled image under static/, if one was built"""
+    return static_image_variants.get(filename)
+
+@app.template_global()
+def srcset(variants, fmt):
+    """srcset attribute value for one format of a derivative manifest"""
+    return build_srcset(variants, fmt, lambda file: url_for('static', filename=file))
+
+@app.template_filter('from_json')
+def from_json(value):
+    return json.loads(value) if value else None
+
+# Return pooled database connections once each request is done
+@app.teardown_appcontext
+def release_db_connection(exception):
+    db.release_connection()
+
 # Initialize admin user if not exists
 def init_admin():
     try:
         # Only create admin user if table doesn't exist
-        conn = sqlite3.connect('bolder_electric.db')
+        conn = db.get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='admin_users'")
         if not cursor.fetchone():
             db.create_admin_user('admin', 'usLaG4wLCnJW1F')
-        conn.close()
     except:
         pass  # Admin user already exists or other error
+    finally:
+        db.release_connection()
 
 init_admin()
 
@@ -77,7 +210,7 @@ def get_client_ip():
         return request.remote_addr
 
 def send_contact_email(name, email, phone, service_type, message):
-    """Send contact form submission email using local postfix"""
+    """Queue a contact form submission email for background delivery"""
     try:
         # Get the recipient email from database
         contact_info = db.get_contact_info()
@@ -102,25 +235,27 @@ This email was sent from the Bolder Electric contact form.
 """
         
         # Create message
+        sender_email = 'noreply@bolderelectric.com'
         msg = MIMEMultipart()
-        msg['From'] = f"Bolder Electric Website <noreply@bolderelectric.com>"
+        msg['From'] = f"Bolder Electric Website <{sender_email}>"
         msg['To'] = recipient_email
         msg['Subject'] = subject
         
         msg.attach(MIMEText(body, 'plain'))
         
-        # Send email using local postfix (much simpler)
-        server = smtplib.SMTP('localhost')
-        server.send_message(msg)
-        server.quit()
+        # Store it in the outbound queue; the mail sender delivers it via local postfix
+        db.enqueue_email(sender_email, recipient_email, msg.as_string())
+        if MAIL_SENDER_THREAD:
+            mail_sender.wake()
         
         return True
         
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         return False
 
 @app.route('/')
+@page_cache.cached('contact_info')
 def home():
     # Get contact info for display
     contact_info = db.get_contact_info()
@@ -144,14 +279,23 @@ def home():
     return render_template('index.html', contact=contact_data)
 
 @app.route('/gallery')
+@page_cache.cached('gallery_photos')
 def gallery():
-    return render_template('gallery.html')
+    """First page of gallery photos; the rest load from /api/gallery as the visitor scrolls"""
+    category = request.args.get('category')
+    if category not in GALLERY_CATEGORIES:
+        category = None
+    photos, next_key = db.get_gallery_page(category, limit=GALLERY_PAGE_SIZE)
+    return render_template('gallery.html', photos=photos, category=category, categories=GALLERY_CATEGORIES,
+                           next_cursor=encode_cursor(next_key) if next_key else None)
 
 @app.route('/commercial')
+@page_cache.cached()
 def commercial():
     return render_template('commercial.html')
 
 @app.route('/residential')
+@page_cache.cached()
 def residential():
     return render_template('residential.html')
 
@@ -174,7 +318,8 @@ def contact_submit():
             }), 400
         
         # Send email
-        email_sent = send_contact_email(name, email, phone, service_type, message)
+        with instrumentation.span('mail'):
+            email_sent = send_contact_email(name, email, phone, service_type, message)
         
         if email_sent:
             return jsonify({
@@ -193,6 +338,60 @@ def contact_submit():
             'message': 'An error occurred. Please try again or call us directly.'
         }), 500
 
+# Categories photos can be filed under, in the order the gallery filter shows them
+GALLERY_CATEGORIES = ('general', 'commercial', 'residential', 'emergency')
+GALLERY_PAGE_SIZE = 12
+MAX_GALLERY_PAGE_SIZE = 48
+# Seconds browsers may reuse a feed page before revalidating it against its ETag
+GALLERY_FEED_MAX_AGE = 60
+
+def gallery_photo_json(photo):
+    """Public fields and image URLs of a get_gallery_page row"""
+    variants = json.loads(photo[6]) if photo[6] else None
+    original = url_for('static', filename='images/gallery/' + photo[1])
+    return {
+        'id': photo[0],
+        'title': photo[2] or '',
+        'description': photo[3] or '',
+        'category': photo[4],
+        'src': url_for('static', filename=variants['jpeg'][-1]['file']) if variants else original,
+        'srcset': {fmt: srcset(variants, fmt) for fmt in ('webp', 'jpeg')} if variants else None,
+        'width': variants['width'] if variants else None,
+        'height': variants['height'] if variants else None
+    }
+
+@app.route('/api/gallery', methods=['GET'])
+def gallery_feed():
+    """Public page of gallery photos for ?category=&cursor=&limit=, with the cursor of the next page"""
+    category = request.args.get('category') or None
+    if category is not None and category not in GALLERY_CATEGORIES:
+        return jsonify({'success': False, 'message': 'Unknown category'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', GALLERY_PAGE_SIZE)), 1), MAX_GALLERY_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, length=2) if cursor else None
+        if after is not None and not all(isinstance(value, int) for value in after):
+            raise ValueError('Invalid cursor')
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor or limit'}), 400
+    
+    # Pages only change with the gallery_photos generation, so it names the representation
+    generation = db.get_generations().get('gallery_photos', 0)
+    position = '.'.join(str(value) for value in after) if after else ''
+    etag = f"{page_cache.version}-{generation}-{category or ''}-{position}-{limit}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        photos, next_key = db.get_gallery_page(category, after, limit)
+        response = jsonify({
+            'photos': [gallery_photo_json(photo) for photo in photos],
+            'next_cursor': encode_cursor(next_key) if next_key else None
+        })
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = GALLERY_FEED_MAX_AGE
+    return response
+
 @app.route('/admin/gallery')
 @admin_required
 def admin_gallery():
@@ -200,63 +399,189 @@ def admin_gallery():
     photos = db.get_gallery_photos()
     return render_template('admin_gallery.html', photos=photos)
 
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    return jsonify({
+        'success': False,
+        'message': f"Upload is too large. The limit is {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB per request."
+    }), 413
+
+def upload_stream_factory(total_content_length, content_type, filename, content_length=None):
+    """Write each uploaded part straight to a temp file, hashing it on the way"""
+    temp_file = gallery_store.temp_file()
+    # Tracked per request so the temp file is removed even if parsing fails part way
+    g.setdefault('upload_temp_files', []).append(temp_file)
+    return temp_file
+
+def remove_upload_temp_files():
+    """Delete this request's upload temp files that weren't moved into the blob store"""
+    for temp_file in g.pop('upload_temp_files', []):
+        temp_file.close()
+        if os.path.exists(temp_file.name):
+            os.remove(temp_file.name)
+
+def parse_upload_form():
+    """Parse a multipart upload ourselves so file parts never sit in memory"""
+    parser = FormDataParser(
+        stream_factory=upload_stream_factory,
+        max_content_length=app.config['MAX_CONTENT_LENGTH'],
+        max_form_memory_size=1024 * 1024
+    )
+    _, form, files = parser.parse_from_environ(request.environ)
+    return form, files
+
+def save_gallery_uploads(uploads, form):
+    """Store uploads by content hash and add their photos in one transaction.
+    
+    Returns a result dict per upload; identical files share one stored blob.
+    """
+    results = []
+    accepted = []
+    for file in uploads:
+        stream = file.stream
+        stream.close()
+        if not file.filename or not allowed_file(file.filename):
+            results.append({
+                'filename': file.filename,
+                'success': False,
+                'message': 'File type not allowed'
+            })
+            continue
+        
+        # Named by the detected format, so the same bytes uploaded as .jpg and .jpeg share a blob
+        extension = upload_extension(stream.name)
+        if extension is None:
+            results.append({
+                'filename': file.filename,
+                'success': False,
+                'message': 'File is not a valid image'
+            })
+            continue
+        
+        digest = stream.hexdigest()
+        blob_key, _ = gallery_store.store(stream.name, digest, extension)
+        extension = os.path.splitext(blob_key)[1]
+        accepted.append((secure_filename(file.filename), digest, extension, stream.size, blob_key))
+        results.append({'filename': file.filename, 'success': True})
+        metrics.inc('upload_bytes_total', stream.size)
+    
+    title = form.get('title', '')
+    description = form.get('description', '')
+    category = form.get('category', 'general')
+    photos = db.add_gallery_photos([
+        (filename, title, description, category, digest, extension, size, blob_key)
+        for filename, digest, extension, size, blob_key in accepted
+    ])
+    
+    photos = iter(photos)
+    for result in results:
+        if result['success']:
+            photo_id, duplicate, processed = next(photos)
+            result['photo_id'] = photo_id
+            result['duplicate'] = duplicate
+            result['status'] = 'done' if processed else 'queued'
+    
+    if any(result.get('status') == 'queued' for result in results) and IMAGE_JOB_THREAD:
+        image_runner.wake()
+    return results
+
 @app.route('/admin/upload-photo', methods=['POST'])
 @admin_required
 def upload_photo():
     """Upload a new photo to gallery"""
     try:
-        if 'PIL_AVAILABLE' not in globals() or not globals()['PIL_AVAILABLE']:
+        if not PIL_AVAILABLE:
             return jsonify({
                 'success': False,
                 'message': 'Image processing not available. Please install Pillow.'
             }), 500
-            
-        if 'photo' not in request.files:
+        
+        form, files = parse_upload_form()
+        uploads = files.getlist('photo')
+        if not uploads or uploads[0].filename == '':
             return jsonify({
                 'success': False,
                 'message': 'No photo file selected'
             }), 400
         
-        file = request.files['photo']
-        if file.filename == '':
+        # Derivatives are rendered by the image workers after the response has gone out
+        result = save_gallery_uploads(uploads[:1], form)[0]
+        if not result['success']:
             return jsonify({
                 'success': False,
-                'message': 'No photo file selected'
+                'message': result['message']
             }), 400
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file_path = os.path.join('static/images/gallery', filename)
-            
-            # Create directory if it doesn't exist
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            
-            # Save file
-            file.save(file_path)
-            
-            # Add to database
-            title = request.form.get('title', '')
-            description = request.form.get('description', '')
-            category = request.form.get('category', 'general')
-            
-            photo_id = db.add_gallery_photo(filename, title, description, category)
+        return jsonify({
+            'success': True,
+            'message': 'Photo uploaded successfully',
+            'photo_id': result['photo_id'],
+            'duplicate': result['duplicate'],
+            'status': result['status']
+        })
             
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error uploading photo: {str(e)}'
+        }), 500
+    finally:
+        # Extra, rejected and unused parts leave their temp files behind
+        remove_upload_temp_files()
+
+@app.route('/admin/upload-photos', methods=['POST'])
+@admin_required
+def upload_photos():
+    """Upload many photos in one request, streaming each file to disk in chunks"""
+    try:
+        if not PIL_AVAILABLE:
             return jsonify({
-                'success': True,
-                'message': 'Photo uploaded successfully',
-                'photo_id': photo_id
-            })
-        else:
+                'success': False,
+                'message': 'Image processing not available. Please install Pillow.'
+            }), 500
+        
+        form, files = parse_upload_form()
+        uploads = files.getlist('photos')
+        if not uploads:
             return jsonify({
                 'success': False,
-                'message': 'File type not allowed'
+                'message': 'No photo files selected',
+                'results': []
             }), 400
-            
+        
+        results = save_gallery_uploads(uploads, form)
+        accepted = [result for result in results if result['success']]
+        return jsonify({
+            'success': bool(accepted),
+            'message': f'{len(accepted)} of {len(uploads)} photos uploaded',
+            'results': results
+        }), 200 if accepted else 400
+    
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Error uploading photo: {str(e)}'
+            'message': f'Error uploading photos: {str(e)}',
+            'results': []
         }), 500
+    finally:
+        # Rejected and unused parts leave their temp files behind
+        remove_upload_temp_files()
+
+@app.route('/admin/photo-status', methods=['GET'])
+@admin_required
+def photo_status():
+    """Processing status of recently uploaded photos, polled by the admin gallery"""
+    photo_ids = [int(i) for i in request.args.get('ids', '').split(',') if i.isdigit()]
+    return jsonify([{
+        'photo_id': row[0],
+        'status': row[1],
+        'error': row[2],
+        'variants': json.loads(row[3]) if row[3] else None
+    } for row in db.get_image_job_status(photo_ids)])
 
 @app.route('/admin/update-photo/<int:photo_id>', methods=['POST'])
 @admin_required
@@ -281,6 +606,35 @@ def update_photo(photo_id):
             'message': f'Error updating photo: {str(e)}'
         }), 500
 
+@app.route('/admin/update-photos', methods=['POST'])
+@admin_required
+def update_photos():
+    """Apply moves and metadata edits from the admin grid in one transaction.
+    
+    Body: {"moves": [{"id": 7, "after_id": 3}], "edits": [{"id": 7, "title": "...", "description": "...",
+           "category": "commercial"}]}
+    Moves apply in order; "after_id": null moves a photo to the front.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        moves = [(int(move['id']), int(move['after_id']) if move.get('after_id') is not None else None)
+                 for move in data.get('moves') or []]
+        edits = []
+        for edit in data.get('edits') or []:
+            category = edit.get('category', 'general')
+            if category not in GALLERY_CATEGORIES:
+                raise ValueError(f'Unknown category: {category}')
+            edits.append((int(edit['id']), edit.get('title', ''), edit.get('description', ''), category))
+        generation = db.update_gallery_photos(moves, edits)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Error updating photos: {e}'}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': f'{len(moves)} moves and {len(edits)} edits saved',
+        'generation': generation
+    })
+
 @app.route('/admin/delete-photo/<int:photo_id>', methods=['POST'])
 @admin_required
 def delete_photo(photo_id):
@@ -303,8 +657,10 @@ def delete_photo(photo_id):
 def reorder_photos():
     """Reorder photos in gallery"""
     try:
+        # {photo id: position}, as sent by older admin pages; stored GALLERY_ORDER_GAP apart
         photo_orders = request.get_json()
-        db.update_photo_order(photo_orders)
+        db.update_photo_order([(int(photo_id), (int(position) + 1) * GALLERY_ORDER_GAP)
+                               for photo_id, position in photo_orders.items()])
         
         return jsonify({
             'success': True,
@@ -324,6 +680,7 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/schedule')
+@page_cache.cached('services', 'time_slots')
 def schedule():
     services = db.get_services()
     time_slots = db.get_time_slots()
@@ -348,9 +705,21 @@ def login():
         ip_address = get_client_ip()
         user_agent = request.headers.get('User-Agent', '')
         
-        success, message = db.verify_admin_login(username, password, ip_address, user_agent)
+        # Turn away bursts before they reach the database
+        allowed, retry_after = login_limiter.check(ip_address, username)
+        if not allowed:
+            response = app.make_response((render_template(
+                'login.html', error=f'Too many login attempts. Please try again in {retry_after} seconds.'
+            ), 429))
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        
+        # Mostly the password hash, which is slow on purpose
+        with instrumentation.span('auth'):
+            success, message = db.verify_admin_login(username, password, ip_address, user_agent)
         
         if success:
+            login_limiter.succeeded(ip_address, username)
             session['admin_logged_in'] = True
             session['admin_username'] = username
             return redirect(url_for('admin'))
@@ -401,7 +770,11 @@ def account():
         return render_template('account.html', success='Password updated successfully')
     
     # Get recent login logs
-    recent_logs = db.get_access_logs(5)
+    recent_logs = [{
+        'ip_address': log[1],
+        'action': log[2],
+        'timestamp': log[4]
+    } for log in db.get_access_logs(5)]
     
     return render_template('account.html', current_user=session['admin_username'], recent_logs=recent_logs)
 
@@ -476,40 +849,252 @@ def set_availability():
     )
     return jsonify({'success': True})
 
+# Longest range the calendar endpoints accept, a little over a quarter
+MAX_AVAILABILITY_DAYS = 92
+
+def parse_date_value(value, name):
+    """A YYYY-MM-DD string from a JSON body as a date"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
+
+def parse_int_list(value, name):
+    """A JSON list of integers as a set"""
+    if not isinstance(value, list) or not all(isinstance(item, int) and not isinstance(item, bool) for item in value):
+        raise ValueError(f'{name} must be a list of numbers')
+    return set(value)
+
+def parse_bool_value(value, name):
+    """A JSON true/false"""
+    if not isinstance(value, bool):
+        raise ValueError(f'{name} must be true or false')
+    return value
+
+def parse_object_list(value, name):
+    """A JSON list of objects"""
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        raise ValueError(f'{name} must be a list of objects')
+    return value
+
+def availability_range(start, end):
+    """Validate a date range for the calendar endpoints"""
+    if end < start:
+        raise ValueError('to must not be before from')
+    if (end - start).days >= MAX_AVAILABILITY_DAYS:
+        raise ValueError(f'Ranges are limited to {MAX_AVAILABILITY_DAYS} days')
+    return start, end
+
+@app.route('/api/availability', methods=['GET'])
+@admin_required
+def get_availability_range():
+    """Availability matrix for ?from=&to= (defaults to the week starting today)"""
+    try:
+        start = parse_date_value(request.args.get('from') or datetime.now().date().isoformat(), 'from')
+        end = parse_date_value(request.args.get('to') or (start + timedelta(days=6)).isoformat(), 'to')
+        start, end = availability_range(start, end)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    time_slots = []
+    days = {}
+    for date, time_slot_id, time_slot, is_available in db.get_availability_range(start.isoformat(), end.isoformat()):
+        if date not in days:
+            days[date] = {}
+        if len(days) == 1:
+            time_slots.append({'id': time_slot_id, 'time_slot': time_slot})
+        days[date][str(time_slot_id)] = bool(is_available) if is_available is not None else True
+    return jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'time_slots': time_slots,
+        'days': [{'date': date, 'slots': slots} for date, slots in days.items()]
+    })
+
+# Browsers and proxies may reuse the open slots this long; a stale slot just gets a 409 on booking
+OPEN_SLOTS_MAX_AGE = 30
+
+@app.route('/api/open-slots', methods=['GET'])
+def get_open_slots():
+    """Public list of bookable time slots per day for ?from=&to= (default: the next two weeks)"""
+    today = datetime.now().date()
+    try:
+        start = parse_date_value(request.args.get('from') or today.isoformat(), 'from')
+        end = parse_date_value(request.args.get('to') or (max(start, today) + timedelta(days=13)).isoformat(), 'to')
+        # Past days can't be booked, so they are never reported as open
+        start, end = availability_range(max(start, today), end)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    response = jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': [{'date': date, 'open': open_slots}
+                 for date, open_slots in db.get_open_slots(start.isoformat(), end.isoformat())]
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = OPEN_SLOTS_MAX_AGE
+    return response
+
+@app.route('/api/availability/bulk', methods=['POST'])
+@admin_required
+def set_availability_bulk():
+    """Apply recurring patterns and single changes over a date range in one transaction.
+    
+    Body: {"from": "2030-01-01", "to": "2030-01-31",
+           "patterns": [{"weekdays": [0, 1, 2, 3, 4], "time_slot_ids": [1, 2], "is_available": true}],
+           "changes": [{"date": "2030-01-15", "time_slot_id": 3, "is_available": false}]}
+    Weekdays count from Monday = 0; a pattern without time_slot_ids covers every active slot.
+    Later patterns override earlier ones and changes override patterns.
+    """
+    data = request.get_json(silent=True)
+    active_slots = [ts[0] for ts in db.get_time_slots()]
+    entries = {}
+    try:
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object')
+        patterns = parse_object_list(data.get('patterns') or [], 'patterns')
+        changes = parse_object_list(data.get('changes') or [], 'changes')
+        if patterns:
+            start, end = availability_range(parse_date_value(data.get('from'), 'from'),
+                                            parse_date_value(data.get('to'), 'to'))
+        for pattern in patterns:
+            weekdays = parse_int_list(pattern.get('weekdays', list(range(7))), 'weekdays')
+            slot_ids = parse_int_list(pattern.get('time_slot_ids', active_slots), 'time_slot_ids')
+            if not weekdays <= set(range(7)):
+                raise ValueError('weekdays must be numbers from 0 (Monday) to 6 (Sunday)')
+            if not slot_ids <= set(active_slots):
+                raise ValueError('Unknown time slot')
+            is_available = parse_bool_value(pattern.get('is_available', True), 'is_available')
+            day = start
+            while day <= end:
+                if day.weekday() in weekdays:
+                    for slot_id in slot_ids:
+                        entries[(day.isoformat(), slot_id)] = is_available
+                day += timedelta(days=1)
+        
+        for change in changes:
+            slot_id = change.get('time_slot_id')
+            if isinstance(slot_id, bool) or slot_id not in active_slots:
+                raise ValueError('Unknown time slot')
+            date = parse_date_value(change.get('date'), 'date').isoformat()
+            entries[(date, slot_id)] = parse_bool_value(change.get('is_available', True), 'is_available')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    updated = db.set_availability_bulk(
+        (date, slot_id, is_available) for (date, slot_id), is_available in entries.items()
+    )
+    return jsonify({'success': True, 'updated': updated})
+
 @app.route('/api/bookings', methods=['POST'])
 def create_booking():
-    data = request.get_json()
-    booking_id = db.add_booking(
-        data['service_id'],
-        data['customer_name'],
-        data['customer_phone'],
-        data['customer_email'],
-        data['customer_address'],
-        data['service_date'],
-        data['time_slot'],
-        data['description'],
-        data['total_price']
-    )
+    """Reserve a time slot; answers 409 when someone else got it first"""
+    data = request.get_json(silent=True) or {}
+    missing = [field for field in ('service_id', 'customer_name', 'customer_phone', 'customer_email',
+                                   'customer_address', 'service_date', 'time_slot')
+               if not data.get(field)]
+    if missing:
+        return jsonify({
+            'success': False,
+            'message': f"Missing fields: {', '.join(missing)}"
+        }), 400
+    
+    try:
+        service_date = datetime.strptime(data['service_date'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'service_date must be a date in YYYY-MM-DD format'
+        }), 400
+    if service_date < datetime.now().date():
+        return jsonify({
+            'success': False,
+            'message': 'Bookings must be for today or later'
+        }), 400
+    
+    try:
+        booking_id = db.add_booking(
+            data['service_id'],
+            data['customer_name'],
+            data['customer_phone'],
+            data['customer_email'],
+            data['customer_address'],
+            service_date.isoformat(),
+            data['time_slot'],
+            data.get('description', '')
+        )
+    except SlotUnavailable as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 409
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     return jsonify({'success': True, 'booking_id': booking_id})
 
 @app.route('/api/bookings', methods=['GET'])
 @admin_required
 def get_bookings():
-    bookings = db.get_bookings()
-    return jsonify([{
-        'id': b[0],
-        'service_id': b[1],
-        'customer_name': b[2],
-        'customer_phone': b[3],
-        'customer_email': b[4],
-        'customer_address': b[5],
-        'service_date': b[6],
-        'time_slot': b[7],
-        'description': b[8],
-        'total_price': b[9],
-        'status': b[10],
-        'service_name': b[11]
-    } for b in bookings])
+    """One page of bookings, filtered by ?from=&to=&status=&service_id= and ordered by date.
+    
+    Pass the returned next_cursor back as ?cursor= for the following page and ?fields= to
+    return only some columns.
+    """
+    try:
+        start_date = parse_date_param('from')
+        end_date = parse_date_param('to')
+        statuses = [s for s in request.args.get('status', '').split(',') if s]
+        service_id = request.args.get('service_id', type=int)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        descending = request.args.get('order', 'desc') != 'asc'
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+        if fields and not set(fields) <= set(BOOKING_FIELDS):
+            raise ValueError(f"Unknown fields: {', '.join(sorted(set(fields) - set(BOOKING_FIELDS)))}")
+        after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    bookings, next_after = db.get_bookings_page(start_date, end_date, statuses, service_id, after,
+                                                limit, fields, descending)
+    return jsonify({
+        'bookings': bookings,
+        'next_cursor': encode_cursor(next_after) if next_after else None
+    })
+
+def parse_date_param(name):
+    """A YYYY-MM-DD query parameter, or None when it's missing"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
+
+CURSOR_PATTERN = re.compile(r'^[A-Za-z0-9_=-]+$')
+
+def encode_cursor(key):
+    """Opaque pagination cursor for a keyset tuple"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, length=3):
+    # urlsafe_b64decode skips characters outside its alphabet, so check them first
+    if not CURSOR_PATTERN.match(cursor):
+        raise ValueError('Invalid cursor')
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if isinstance(key, list) and len(key) == length:
+            return tuple(key)
+    except (ValueError, TypeError):
+        pass
+    raise ValueError('Invalid cursor')
 
 @app.route('/api/contact', methods=['GET'])
 @admin_required
@@ -548,23 +1133,101 @@ def update_contact():
 @app.route('/api/logs', methods=['GET'])
 @admin_required
 def get_logs():
-    logs = db.get_access_logs(100)
+    """One page of access logs, newest first, filtered by ?action=&from=&to=.
+    
+    Rows older than the retention period are only in /api/logs/daily; pass the returned
+    next_cursor back as ?cursor= for the following page.
+    """
+    try:
+        action = request.args.get('action')
+        if action == 'all':
+            action = None
+        since = parse_date_param('from')
+        until = parse_date_param('to')
+        if until:
+            # ?to= is inclusive, so stop before the next day starts
+            until = (datetime.strptime(until, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        before = decode_cursor(request.args['cursor'], 2) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    logs = db.get_access_logs(limit, action, since, until, before)
+    return jsonify({
+        'logs': [{
+            'username': log[0],
+            'ip_address': log[1],
+            'action': log[2],
+            'success': log[3],
+            'timestamp': log[4]
+        } for log in logs],
+        'next_cursor': encode_cursor([logs[-1][4], logs[-1][5]]) if len(logs) == limit else None
+    })
+
+@app.route('/api/logs/daily', methods=['GET'])
+@admin_required
+def get_log_rollups():
+    """Daily counts per action, outcome and IP for ?from=&to= (default: the last 30 days)"""
+    try:
+        end_day = parse_date_param('to') or datetime.utcnow().strftime('%Y-%m-%d')
+        start_day = parse_date_param('from') or (
+            datetime.strptime(end_day, '%Y-%m-%d') - timedelta(days=29)).strftime('%Y-%m-%d')
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    rollups = db.get_access_log_rollups(start_day, end_day, request.args.get('action'))
     return jsonify([{
-        'username': log[0],
-        'ip_address': log[1],
-        'action': log[2],
-        'success': log[3],
-        'timestamp': log[4]
-    } for log in logs])
+        'day': r[0],
+        'action': r[1],
+        'success': bool(r[2]),
+        'ip_address': r[3],
+        'attempts': r[4],
+        'first_seen': r[5],
+        'last_seen': r[6]
+    } for r in rollups])
+
+@app.route('/api/stats', methods=['GET'])
+@admin_required
+def get_stats():
+    return jsonify({
+        'db_pool': db.get_pool_stats(),
+        'write_queue': db.get_write_stats(),
+        'access_log': db.get_access_log_stats(),
+        'login_rate_limit': login_limiter.get_stats(),
+        'cache': db.get_cache_stats(),
+        'email_queue': db.get_email_queue_stats(),
+        'mail_sender': mail_sender.get_stats(),
+        'image_jobs': db.get_image_queue_stats(),
+        'image_runner': image_runner.get_stats(),
+        'page_cache': page_cache.get_stats(),
+        'gallery_storage': db.get_gallery_storage_stats(),
+        'instrumentation': instrumentation.get_stats()
+    })
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics for every worker, for admins or a scraper holding METRICS_TOKEN"""
+    authorization = request.headers.get('Authorization', '')
+    token_ok = METRICS_TOKEN and hmac.compare_digest(authorization.encode(), f'Bearer {METRICS_TOKEN}'.encode())
+    if 'admin_logged_in' not in session and not token_ok:
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    if not metrics.enabled:
+        return jsonify({'success': False, 'message': 'Metrics are disabled; set METRICS=1'}), 404
+    
+    response = app.response_class(metrics.render(db), content_type='text/plain; version=0.0.4; charset=utf-8')
+    response.cache_control.no_store = True
+    return response
 
 @app.route('/sitemap.xml')
 def sitemap():
-    return send_from_directory('static', 'sitemap.xml')
+    return send_static('sitemap.xml')
 
 @app.route('/robots.txt')
 def robots():
-    return send_from_directory('static', 'robots.txt')
-
-if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    return send_static('robots.txt')
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Credential-stuffing burst against verify_admin_login.
+
+Many threads send failed logins at once, the way a burst against /login
+does, and the script reports throughput, how many access-log batches it
+took to write them, and that every row reached the table after close().
+
+    python benchmarks/access_log_burst.py [--threads 16] [--attempts 500]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from passwords import PasswordHasher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=500, help='logins per thread')
+    options = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='access-log-burst-')
+    db_path = os.path.join(work_dir, 'burst.db')
+    try:
+        # Cheap hashing, so the burst measures logging rather than the KDF
+        db = DatabaseManager(db_path, password_hasher=PasswordHasher(cost=1000))
+
+        def attack(thread_number):
+            for attempt in range(options.attempts):
+                db.verify_admin_login(f'user{attempt % 50}', 'guess', f'10.0.{thread_number}.1', 'burst')
+
+        threads = [threading.Thread(target=attack, args=(n,)) for n in range(options.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        db.close()
+        stats = db.get_access_log_stats()
+
+        check = DatabaseManager(db_path, password_hasher=PasswordHasher(cost=1000))
+        rows = check.get_connection().execute('SELECT COUNT(*) FROM access_logs').fetchone()[0]
+        check.close()
+
+        attempts = options.threads * options.attempts
+        print(f'{attempts} login attempts in {elapsed:.2f}s ({attempts / elapsed:.0f}/s)')
+        print(f"{stats['written']} rows in {stats['flushes']} batches, {stats['dropped']} dropped, "
+              f'{rows} in access_logs')
+        if rows + stats['dropped'] != attempts:
+            print(f"FAIL: {attempts - rows - stats['dropped']} rows lost")
+            return 1
+        print('OK: every attempt was logged or counted as dropped')
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
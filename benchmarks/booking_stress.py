@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Concurrency stress test for booking reservations.
+
+Starts several processes, each with its own DatabaseManager (and so its own
+writer thread) on one scratch database, and has many threads per process
+book the same few time slots at once. Every slot must end up with at most
+its capacity of bookings, every attempt must either succeed or get a clean
+SlotUnavailable, the successful bookings must match the reservations, and
+the full slots must no longer be listed as open.
+
+    python benchmarks/booking_stress.py [--processes 4] [--threads 16] [--attempts 50]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager, SlotUnavailable
+
+DATES = ['2030-03-04', '2030-03-05']
+SLOTS = ['8:00 AM', '9:00 AM', '10:00 AM']
+
+
+def worker(db_path, threads, attempts, results):
+    """Book random slots from several threads; report (booked, conflicts, errors)"""
+    db = DatabaseManager(db_path)
+    counts = {'booked': 0, 'conflicts': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def book(thread_number):
+        for attempt in range(attempts):
+            date = DATES[(thread_number + attempt) % len(DATES)]
+            slot = SLOTS[(thread_number * 7 + attempt) % len(SLOTS)]
+            try:
+                db.add_booking(1, f'Stress {os.getpid()}-{thread_number}', '555-0100', 'stress@example.com',
+                               '1 Test St', date, slot, 'stress test')
+                outcome = 'booked'
+            except SlotUnavailable:
+                outcome = 'conflicts'
+            except Exception as e:
+                print(f'Booking error: {e}')
+                outcome = 'errors'
+            with lock:
+                counts[outcome] += 1
+
+    pool = [threading.Thread(target=book, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    db.close()
+    results.put(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--attempts', type=int, default=50)
+    parser.add_argument('--capacity', type=int, default=2, help='bookings each time slot takes')
+    options = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='booking-stress-')
+    db_path = os.path.join(work_dir, 'stress.db')
+    try:
+        db = DatabaseManager(db_path)
+        db.run_write(lambda cursor: cursor.execute('UPDATE time_slots SET capacity = ?', (options.capacity,)))
+        db.rebuild_slot_bitmaps()
+        db.close()
+
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker,
+                                             args=(db_path, options.threads, options.attempts, results))
+                     for _ in range(options.processes)]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        totals = {'booked': 0, 'conflicts': 0, 'errors': 0}
+        for _ in processes:
+            for key, value in results.get().items():
+                totals[key] += value
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        db = DatabaseManager(db_path)
+        conn = db.get_connection()
+        per_slot = conn.execute('''
+            SELECT service_date, time_slot, COUNT(*) FROM bookings GROUP BY service_date, time_slot
+        ''').fetchall()
+        reservations = conn.execute('SELECT COUNT(*) FROM slot_reservations').fetchone()[0]
+        still_open = [(date, slot) for date, open_slots in db.get_open_slots(DATES[0], DATES[-1])
+                      for slot in open_slots if slot in SLOTS]
+        db.close()
+
+        attempts = options.processes * options.threads * options.attempts
+        print(f'{attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:.0f}/s): '
+              f"{totals['booked']} booked, {totals['conflicts']} conflicts, {totals['errors']} errors")
+        failures = []
+        overbooked = [row for row in per_slot if row[2] > options.capacity]
+        if overbooked:
+            failures.append(f'overbooked slots: {overbooked}')
+        expected = len(DATES) * len(SLOTS) * options.capacity
+        if totals['booked'] != expected:
+            failures.append(f"expected {expected} bookings, got {totals['booked']}")
+        if reservations != totals['booked']:
+            failures.append(f"{reservations} reservations for {totals['booked']} bookings")
+        if still_open:
+            failures.append(f'full slots still listed as open: {still_open}')
+        if totals['errors']:
+            failures.append(f"{totals['errors']} attempts failed with errors")
+        for failure in failures:
+            print(f'FAIL: {failure}')
+        if not failures:
+            print('OK: no slot over capacity')
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
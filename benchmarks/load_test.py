@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""Load test for the main pages and APIs against a seeded database.
+
+Seeds a scratch SQLite database with realistic volumes, then drives the real
+app either in process through Flask's WSGI test client or over HTTP against a
+local gunicorn. Every scenario is measured separately: it gets a short warm-up,
+then a fixed number of requests spread over the client threads. The script
+prints throughput and latency percentiles and writes everything to a JSON
+file. Pass an older file as --compare to see what changed between releases.
+
+    python benchmarks/load_test.py [--mode wsgi|gunicorn] [--concurrency 8] [--requests 1000]
+    python benchmarks/load_test.py --bookings 1000 --access-logs 10000 --photos 100   # quick run
+    python benchmarks/load_test.py --compare benchmarks/results/<earlier run>.json
+
+The seeded database is kept when --db names a file, and reused as-is next time.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import itertools
+import subprocess
+import http.client
+from urllib.parse import urlencode
+from datetime import datetime, timedelta, timezone
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+ADMIN = ('admin', 'usLaG4wLCnJW1F')
+SCENARIOS = ['home', 'schedule', 'gallery', 'bookings_list', 'login', 'bookings_create']
+ACTIONS = ['login_attempt', 'login_success', 'login_failed', 'logout', 'password_change']
+CATEGORIES = ['general', 'commercial', 'residential', 'emergency']
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def seed(db_path, bookings, access_logs, photos, rng, password_cost=None):
+    """Create the schema through DatabaseManager, then bulk-insert the volumes directly"""
+    from database import DatabaseManager, GALLERY_ORDER_GAP
+    from passwords import PasswordHasher
+
+    # Hash the admin password at the cost the app will run with, so logins don't rehash it
+    db = DatabaseManager(db_path, password_hasher=PasswordHasher(cost=password_cost) if password_cost else None)
+    db.close()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('BEGIN')
+    slots = [row[0] for row in conn.execute('SELECT time_slot FROM time_slots ORDER BY id')]
+    services = conn.execute('SELECT id, base_price FROM services').fetchall()
+    today = datetime.now().date()
+
+    # Past bookings, one seat per date and slot, so the reservations stay consistent
+    first_day = today - timedelta(days=bookings // len(slots) + 2)
+    rows = []
+    for n in range(bookings):
+        service_id, price = services[n % len(services)]
+        day = (first_day + timedelta(days=n // len(slots))).isoformat()
+        rows.append((n + 1, service_id, f'Customer {n}', f'555-{n % 10000:04d}', f'customer{n}@example.com',
+                     f'{n} Main St', day, slots[n % len(slots)], 'Seeded booking', price,
+                     rng.choice(['pending', 'confirmed', 'completed', 'cancelled'])))
+    conn.executemany('''
+        INSERT INTO bookings (id, service_id, customer_name, customer_phone, customer_email, customer_address,
+                              service_date, time_slot, description, total_price, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.executemany('''
+        INSERT INTO slot_reservations (service_date, time_slot, seat, booking_id) VALUES (?, ?, 0, ?)
+    ''', [(row[6], row[7], row[0]) for row in rows])
+
+    # Access logs over the last 90 days, inside the default retention period
+    now = datetime.now(timezone.utc)
+    step = 90 * 86400 / max(access_logs, 1)
+    for start in range(0, access_logs, 100000):
+        conn.executemany('''
+            INSERT INTO access_logs (username, ip_address, user_agent, action, success, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(rng.choice(['admin', 'root', 'test', f'user{n % 500}']),
+               f'10.{n % 256}.{(n // 256) % 256}.{rng.randrange(256)}', 'load-test',
+               rng.choice(ACTIONS), rng.random() < 0.3,
+               (now - timedelta(seconds=(access_logs - n) * step)).strftime('%Y-%m-%d %H:%M:%S'))
+              for n in range(start, min(start + 100000, access_logs))])
+
+    # Photos with derivative manifests, so every one is public
+    variants = json.dumps({'width': 1440, 'height': 1080,
+                           'webp': [{'file': f'images/gallery/seed-{w}w.webp', 'width': w} for w in (320, 800, 1440)],
+                           'jpeg': [{'file': f'images/gallery/seed-{w}w.jpg', 'width': w} for w in (320, 800, 1440)]})
+    conn.executemany('''
+        INSERT INTO gallery_photos (filename, title, description, category, display_order, variants)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(f'seed-{n}.jpg', f'Project {n}', 'Seeded photo', rng.choice(CATEGORIES),
+           (n + 1) * GALLERY_ORDER_GAP, variants) for n in range(photos)])
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    conn.close()
+
+    db = DatabaseManager(db_path)
+    db.rebuild_slot_bitmaps()
+    db.close()
+    return slots, [service[0] for service in services]
+
+
+class BookingSlots:
+    """Hands out distinct future (date, time slot) pairs, so every POST can succeed"""
+
+    def __init__(self, slots, days_ahead=30):
+        self.slots = slots
+        self.first_day = datetime.now().date() + timedelta(days=days_ahead)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            n = next(self._counter)
+        return (self.first_day + timedelta(days=n // len(self.slots))).isoformat(), self.slots[n % len(self.slots)]
+
+
+class WsgiClient:
+    """Flask test client; one per thread"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def login(self):
+        with self.client.session_transaction() as session:
+            session['admin_logged_in'] = True
+            session['admin_username'] = ADMIN[0]
+
+    def request(self, method, path, json_body=None, form=None):
+        response = self.client.open(path, method=method, json=json_body, data=form)
+        response.close()
+        return response.status_code
+
+
+class HttpClient:
+    """Keep-alive HTTP client with a session cookie; one per thread"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookie = None
+
+    def login(self):
+        self.request('POST', '/login', form={'username': ADMIN[0], 'password': ADMIN[1]})
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        for attempt in range(2):
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # gunicorn's sync workers close idle connections; reconnect once
+                self.connection.close()
+                if attempt:
+                    raise
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie and set_cookie.startswith('session='):
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status
+
+
+def scenario_request(name, client, booking_slots, service_ids, n):
+    """Send one request of a scenario and return its status code"""
+    if name == 'home':
+        return client.request('GET', '/')
+    if name == 'schedule':
+        return client.request('GET', '/schedule')
+    if name == 'gallery':
+        return client.request('GET', '/gallery')
+    if name == 'bookings_list':
+        return client.request('GET', '/api/bookings?limit=50')
+    if name == 'login':
+        return client.request('POST', '/login', form={'username': ADMIN[0], 'password': ADMIN[1]})
+    service_date, time_slot = booking_slots.next()
+    return client.request('POST', '/api/bookings', json_body={
+        'service_id': service_ids[n % len(service_ids)],
+        'customer_name': f'Load Test {n}',
+        'customer_phone': '555-0100',
+        'customer_email': 'load@example.com',
+        'customer_address': '1 Test St',
+        'service_date': service_date,
+        'time_slot': time_slot,
+        'description': 'load test'
+    })
+
+
+def run_scenario(name, make_client, requests, concurrency, warmup, booking_slots, service_ids):
+    """Run one scenario; returns its summary dict"""
+    clients = [make_client() for _ in range(concurrency)]
+    for client in clients:
+        client.login()
+    for n in range(warmup):
+        scenario_request(name, clients[0], booking_slots, service_ids, n)
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def drive(client):
+        while True:
+            n = next(counter)
+            if n >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                status = scenario_request(name, client, booking_slots, service_ids, n)
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=drive, args=(client,)) for client in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': statuses,
+        'seconds': round(wall, 3),
+        'throughput': round(len(latencies) / wall, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+    }
+
+
+def app_environment(db_path, work_dir, options):
+    """Environment for the app under test: no background threads, no login throttling"""
+    env = {
+        'DATABASE_PATH': db_path,
+        'IMAGE_JOB_THREAD': '0',
+        'MAIL_SENDER_THREAD': '0',
+        'LOGIN_RATE_LIMIT_FILE': os.path.join(work_dir, 'login-buckets'),
+        'LOGIN_IP_BURST': '1000000000',
+        'LOGIN_USER_BURST': '1000000000'
+    }
+    if options.password_cost:
+        env['PASSWORD_HASH_COST'] = str(options.password_cost)
+    return env
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(env, workers, threads):
+    """Start gunicorn on a free local port and wait until it answers"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=REPO, env=dict(os.environ, **env)
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 60 seconds')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} ({baseline['meta'].get('revision')}, {baseline['meta']['started']}):")
+    print(f"{'scenario':<16} {'throughput':>12} {'p95':>10} {'p99':>10}")
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        change = lambda key: (result[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{name:<16} {change('throughput'):>+11.1f}% {change('p95_ms'):>+9.1f}% {change('p99_ms'):>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--mode', default='wsgi', choices=['wsgi', 'gunicorn'])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset to run')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario')
+    parser.add_argument('--login-requests', type=int, default=50, help='requests for the login scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=3, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--bookings', type=int, default=100000)
+    parser.add_argument('--access-logs', type=int, default=1000000)
+    parser.add_argument('--photos', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password-cost', type=int, help='PASSWORD_HASH_COST (default: calibrated)')
+    parser.add_argument('--db', help='seeded database to create, or reuse if it exists')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<time>-<mode>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    options = parser.parse_args()
+    scenarios = [name for name in options.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    work_dir = tempfile.mkdtemp(prefix='load-test-')
+    db_path = os.path.abspath(options.db) if options.db else os.path.join(work_dir, 'load.db')
+    started_at = datetime.now(timezone.utc)
+    try:
+        if os.path.exists(db_path):
+            print(f'Reusing {db_path}')
+            conn = sqlite3.connect(db_path)
+            slots = [row[0] for row in conn.execute('SELECT time_slot FROM time_slots ORDER BY id')]
+            service_ids = [row[0] for row in conn.execute('SELECT id FROM services')]
+            conn.close()
+            seed_seconds = None
+        else:
+            print(f'Seeding {options.bookings} bookings, {options.access_logs} access logs and '
+                  f'{options.photos} photos...')
+            seed_started = time.perf_counter()
+            slots, service_ids = seed(db_path, options.bookings, options.access_logs, options.photos,
+                                      random.Random(options.seed), options.password_cost)
+            seed_seconds = round(time.perf_counter() - seed_started, 1)
+            print(f'Seeded in {seed_seconds}s')
+
+        env = app_environment(db_path, work_dir, options)
+        gunicorn = None
+        if options.mode == 'wsgi':
+            os.environ.update(env)
+            import app as application
+            make_client = lambda: WsgiClient(application.app)
+        else:
+            gunicorn, port = start_gunicorn(env, options.workers, options.threads)
+            make_client = lambda: HttpClient('127.0.0.1', port)
+
+        booking_slots = BookingSlots(slots)
+        results = {}
+        try:
+            print(f"\n{options.mode}, {options.concurrency} client threads")
+            print(f"{'scenario':<16} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+            for name in scenarios:
+                requests = options.login_requests if name == 'login' else options.requests
+                warmup = min(options.warmup, 2) if name == 'login' else options.warmup
+                result = run_scenario(name, make_client, requests, options.concurrency, warmup,
+                                      booking_slots, service_ids)
+                results[name] = result
+                print(f"{name:<16} {result['requests']:>8} {result['errors']:>7} {result['throughput']:>9.1f} "
+                      f"{result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms {result['p99_ms']:>7.1f}ms")
+        finally:
+            if gunicorn is not None:
+                gunicorn.terminate()
+                gunicorn.wait(timeout=30)
+
+        report = {
+            'meta': {
+                'started': started_at.isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'mode': options.mode,
+                'concurrency': options.concurrency,
+                'workers': options.workers if options.mode == 'gunicorn' else None,
+                'threads': options.threads if options.mode == 'gunicorn' else None,
+                'volumes': {'bookings': options.bookings, 'access_logs': options.access_logs,
+                            'photos': options.photos} if seed_seconds is not None else 'reused',
+                'seed': options.seed,
+                'seed_seconds': seed_seconds,
+                'password_cost': options.password_cost,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'cpus': os.cpu_count()
+            },
+            'results': results
+        }
+        output = options.output or os.path.join(
+            REPO, 'benchmarks', 'results', f"{started_at.strftime('%Y%m%dT%H%M%SZ')}-{options.mode}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nWrote {output}')
+
+        if options.compare:
+            compare(results, options.compare)
+        return 1 if any(result['errors'] for result in results.values()) else 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Login latency under concurrent attempts at several password hash costs.
+
+For each cost, a fresh admin user is created and many threads log in with
+the right password at once, the way gunicorn's threads would. p50/p99 and
+throughput show how much a cost slows logins down once attempts queue up
+for the CPU; pick the largest cost whose p99 is still acceptable and set it
+with PASSWORD_HASH_COST (or PASSWORD_HASH_MS to calibrate at startup).
+
+    python benchmarks/login_latency.py [--algorithm scrypt] [--costs 100000,300000] [--threads 8]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from passwords import PasswordHasher
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(work_dir, hasher, threads, attempts):
+    """Seconds per login for threads * attempts concurrent successful logins, and the wall time"""
+    db = DatabaseManager(os.path.join(work_dir, f'{hasher.algorithm}-{hasher.cost}.db'), password_hasher=hasher)
+    db.create_admin_user('bench', 'correct horse battery staple')
+    latencies = []
+    lock = threading.Lock()
+
+    def login(thread_number):
+        for _ in range(attempts):
+            started = time.perf_counter()
+            success, message = db.verify_admin_login('bench', 'correct horse battery staple',
+                                                     f'10.0.0.{thread_number}', 'bench')
+            elapsed = time.perf_counter() - started
+            if not success:
+                raise RuntimeError(message)
+            with lock:
+                latencies.append(elapsed)
+
+    pool = [threading.Thread(target=login, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - started
+    db.close()
+    return latencies, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--algorithm', default='pbkdf2_sha256', choices=['pbkdf2_sha256', 'scrypt'])
+    parser.add_argument('--costs', help='comma-separated costs (default: calibrated for 50, 100 and 250 ms)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=5, help='logins per thread')
+    options = parser.parse_args()
+
+    if options.costs:
+        costs = [int(cost) for cost in options.costs.split(',')]
+    else:
+        calibrating = PasswordHasher(options.algorithm)
+        costs = sorted({calibrating.calibrate(ms / 1000.0) for ms in (50, 100, 250)})
+
+    print(f'{options.algorithm}, {options.threads} threads x {options.attempts} logins, {os.cpu_count()} CPUs')
+    print(f"{'cost':>10} {'single':>9} {'p50':>9} {'p99':>9} {'logins/s':>9}")
+    work_dir = tempfile.mkdtemp(prefix='login-latency-')
+    try:
+        for cost in costs:
+            hasher = PasswordHasher(options.algorithm, cost=cost)
+            started = time.perf_counter()
+            hasher.hash('single')
+            single = time.perf_counter() - started
+            latencies, wall = measure(work_dir, hasher, options.threads, options.attempts)
+            print(f'{cost:>10} {single * 1000:>7.0f}ms {percentile(latencies, 0.5) * 1000:>7.0f}ms '
+                  f'{percentile(latencies, 0.99) * 1000:>7.0f}ms {len(latencies) / wall:>9.1f}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
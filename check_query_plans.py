@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""EXPLAIN QUERY PLAN check for every query DatabaseManager runs.
+
+Builds a throwaway database, calls each public DatabaseManager method with
+sample arguments while tracing the SQL it executes, and reports statements
+that scan a whole table or sort without an index. Exits non-zero on any
+problem, or when a public method isn't exercised here, so new queries can't
+slip in without a plan check.
+
+    python check_query_plans.py [-v]
+"""
+
+import os
+import re
+import sys
+import shutil
+import tempfile
+
+from database import DatabaseManager
+
+# Configuration tables that stay at a handful of rows; scanning them is fine
+SMALL_TABLES = {'admin_users', 'contact_info', 'services', 'time_slots', 'cache_generations'}
+
+# Known plans that are fine as they are: (method, problem) -> reason
+ALLOWED = {
+    ('get_availability', 'sort without an index'): 'sorts the rows of the small time_slots table',
+    ('claim_emails', 'sort without an index'): 'sorts only the due rows of the mail queue',
+    ('claim_image_jobs', 'sort without an index'): 'sorts only the queued rows of the job queue',
+    ('get_gallery_storage_stats', 'full scan of gallery_blobs'): 'aggregates over every blob by design',
+    ('get_availability_range', 'sort without an index'): 'sorts at most 92 days of time slots',
+    ('rebuild_slot_bitmaps', 'full scan of slot_reservations'): 'rebuilds every bitmap by design',
+    ('rollup_access_logs', 'sort without an index'): 'groups one archived batch of at most 5000 rows',
+    ('get_access_log_rollups', 'sort without an index'): 'orders the rollups of one date range'
+}
+
+# Methods that don't run application queries of their own
+NOT_QUERIES = {
+    'close', 'get_connection', 'release_connection', 'run_write', 'run_cached_write', 'hash_password',
+    'init_database', 'migrate', 'migrations', 'seed_default_data', 'get_schema_version',
+    'get_pool_stats', 'get_write_stats', 'get_access_log_stats', 'get_cache_stats', 'get_generations'
+}
+
+# Statements that are not queries
+SKIPPED = re.compile(r'^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|CREATE|ALTER|DROP)\b', re.I)
+CTE_NAME = re.compile(r'(?:\bWITH(?:\s+RECURSIVE)?|,)\s+(\w+)\s*(?:\([^)]*\))?\s+AS\s*\(', re.I)
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(?!WHERE|JOIN|LEFT|ON|SET|ORDER|GROUP|LIMIT|VALUES)(\w+))?', re.I)
+
+
+class TracingDatabaseManager(DatabaseManager):
+    """DatabaseManager that records every statement its connections execute"""
+
+    def __init__(self, *args, **kwargs):
+        self.statements = []
+        self.tracing = False
+        super().__init__(*args, **kwargs)
+
+    def _connect(self, isolation_level=''):
+        conn = super()._connect(isolation_level)
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, statement):
+        if self.tracing:
+            self.statements.append((self.current_method, statement))
+
+
+def exercise(db):
+    """Call every public query method once; returns {method name: error or None}"""
+    calls = [
+        ('create_admin_user', ('planner', 'secret')),
+        ('verify_admin_login', ('planner', 'secret', '127.0.0.1', 'check')),
+        ('log_access', ('planner', '127.0.0.1', 'check', 'login_attempt', False)),
+        ('get_access_logs', (50, 'login_attempt', '2030-01-01', '2030-02-01', ('2030-01-15 00:00:00', 10))),
+        ('get_expired_access_logs', ('2030-01-01 00:00:00', 5000)),
+        ('rollup_access_logs', ('2030-01-01 00:00:00', ('2029-12-31 00:00:00', 10))),
+        ('get_access_log_rollups', ('2029-12-01', '2029-12-31', 'login_attempt')),
+        ('update_admin_password', ('planner', 'secret2')),
+        ('get_contact_info', ()),
+        ('update_contact_info', ('555', 'a@b.c', 'addr', 'area', 'hours')),
+        ('add_service', ('Check', 'desc', 10.0)),
+        ('update_service', (1, 'Check', 'desc', 12.0)),
+        ('delete_service', (6,)),
+        ('get_services', ()),
+        ('get_time_slots', ()),
+        ('set_availability', ('2030-01-02', 1, True)),
+        ('get_availability', ('2030-01-02',)),
+        ('get_availability_range', ('2030-01-01', '2030-01-31')),
+        ('set_availability_bulk', ([('2030-01-03', 1, False), ('2030-01-03', 2, True)],)),
+        ('add_booking', (1, 'Name', '555', 'a@b.c', 'addr', '2030-01-02', '8:00 AM', 'desc')),
+        ('get_slot_positions', ()),
+        ('get_slot_bitmaps', ('2030-01-01', '2030-01-14')),
+        ('get_open_slots', ('2030-01-01', '2030-01-14')),
+        ('rebuild_slot_bitmaps', ()),
+        ('get_bookings', ('2030-01-02',)),
+        ('get_bookings_page', ('2030-01-01', '2030-12-31', ['pending'], None, ('2030-06-01', '9:00 AM', 5), 50)),
+        ('add_gallery_photo', ('a.jpg', 'A', '', 'general', 0, None, 'aa/a.jpg')),
+        ('add_gallery_photos', ([('b.jpg', 'B', '', 'general', 'b' * 64, '.jpg', 10, 'bb/b.jpg')],)),
+        ('get_gallery_photos', ('general',)),
+        ('get_gallery_page', ('general', (0, 1), 12)),
+        ('get_image_job_status', ([1, 2],)),
+        ('claim_image_jobs', (4,)),
+        ('complete_image_job', (1, 1, {'width': 1, 'height': 1})),
+        ('fail_image_job', (2, 'error')),
+        ('get_image_queue_stats', ()),
+        ('update_gallery_photo', (1, 'A', '', 'general', 0)),
+        ('update_gallery_photos', ([(1, None), (1, 2)], [(1, 'A', '', 'general')])),
+        ('update_photo_order', ([(1, 1), (2, 2)],)),
+        ('delete_gallery_photo', (2,)),
+        ('release_unreferenced_blobs', (0,)),
+        ('get_gallery_storage_stats', ()),
+        ('enqueue_email', ('a@b.c', 'd@e.f', 'message')),
+        ('claim_emails', (20,)),
+        ('mark_emails_sent', ([1],)),
+        ('mark_email_failed', (1, 'error', 30)),
+        ('get_email_queue_stats', ()),
+        ('store_cached_page', ('key', '/', 'etag', 'text/html', b'body')),
+        ('get_cached_page', ('key',)),
+        ('clear_page_cache', ()),
+    ]
+    errors = {}
+    db.tracing = True
+    for name, args in calls:
+        db.current_method = name
+        try:
+            getattr(db, name)(*args)
+            errors[name] = None
+        except Exception as e:
+            errors[name] = f'{type(e).__name__}: {e}'
+    db.tracing = False
+    return errors
+
+
+def plan_problems(conn, statement):
+    """Full table scans and unindexed sorts in a statement's query plan"""
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(statement):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement)]
+    # Common table expressions are generated rows, not stored tables
+    small = SMALL_TABLES | set(CTE_NAME.findall(statement))
+
+    problems = []
+    tables = set()
+    for detail in plan:
+        match = re.match(r'(SCAN|SEARCH) (\w+)', detail)
+        if match and detail != 'SCAN CONSTANT ROW':
+            table = aliases.get(match.group(2), match.group(2))
+            tables.add(table)
+            if match.group(1) == 'SCAN' and ' USING ' not in detail and table not in small:
+                problems.append(f'full scan of {table}')
+    if any(detail.startswith('USE TEMP B-TREE') for detail in plan) and not tables <= small:
+        problems.append('sort without an index')
+    return plan, problems
+
+
+def main(verbose=False):
+    work_dir = tempfile.mkdtemp(prefix='query-plans-')
+    try:
+        db = TracingDatabaseManager(os.path.join(work_dir, 'plans.db'))
+        errors = exercise(db)
+        conn = db.get_connection()
+
+        failures = 0
+        checked = set()
+        for method, statement in db.statements:
+            if SKIPPED.match(statement) or (method, statement) in checked:
+                continue
+            checked.add((method, statement))
+            plan, problems = plan_problems(conn, statement)
+            problems = [problem for problem in problems if (method, problem) not in ALLOWED]
+            if problems or verbose:
+                print(f"{method}: {' '.join(statement.split())[:160]}")
+                for detail in plan:
+                    print(f'    {detail}')
+            for problem in problems:
+                print(f'    PROBLEM: {problem}')
+                failures += 1
+
+        for method, error in errors.items():
+            if error:
+                print(f'{method} failed: {error}')
+                failures += 1
+
+        public = {name for name in dir(DatabaseManager)
+                  if not name.startswith('_') and callable(getattr(DatabaseManager, name))}
+        for name in sorted(public - NOT_QUERIES - set(errors)):
+            print(f'{name} is not exercised by check_query_plans.py')
+            failures += 1
+
+        print(f'{len(checked)} statements checked, {failures} problems')
+        db.close()
+        return 1 if failures else 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main(verbose='-v' in sys.argv))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""gzip/brotli compression for dynamic responses and precompressed static files.
+
+HTML and JSON responses are compressed after the request, negotiated on
+Accept-Encoding. Text files under static/ get .br/.gz siblings once, at
+startup or deploy time, so serving them costs no CPU per request.
+"""
+
+import os
+import gzip
+import zlib
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Responses smaller than this aren't worth the CPU or the extra headers
+MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'
+}
+STATIC_EXTENSIONS = {'.css', '.js', '.svg', '.xml', '.txt', '.json', '.html'}
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Fast settings for per-request work; static files are compressed once at the maximum
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def available_encodings():
+    """Encodings we can produce, in order of preference"""
+    return ['br', 'gzip'] if BROTLI_AVAILABLE else ['gzip']
+
+
+def negotiate(accept_encodings, encodings=None):
+    """Pick the best encoding the client accepts (a werkzeug Accept object), or None"""
+    return accept_encodings.best_match(encodings or available_encodings())
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks, flushing after each one so streaming keeps going"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place when the client and content type allow it"""
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    encoding = negotiate(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(
+            (chunk.encode(response.charset) if isinstance(chunk, str) else chunk
+             for chunk in response.response),
+            encoding
+        )
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # Each encoding is a different representation of the resource
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def precompress_static(static_dir='static'):
+    """Write .br/.gz siblings for text assets, skipping ones that are already up to date"""
+    written = 0
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in STATIC_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) < MIN_SIZE:
+                continue
+            with open(path, 'rb') as f:
+                data = None
+                for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+                    target = path + suffix
+                    if encoding == 'br' and not BROTLI_AVAILABLE:
+                        continue
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    if data is None:
+                        data = f.read()
+                    if encoding == 'br':
+                        compressed = brotli.compress(data, quality=11)
+                    else:
+                        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                    tmp_path = f'{target}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'wb') as out:
+                        out.write(compressed)
+                    os.replace(tmp_path, target)
+                    written += 1
+    return written
+
+
+def precompressed_sibling(static_dir, filename, accept_encodings):
+    """Name and encoding of the best precompressed copy of a static file the client accepts"""
+    if os.path.splitext(filename)[1].lower() not in STATIC_EXTENSIONS:
+        return None, None
+    candidates = [encoding for encoding in ('br', 'gzip')
+                  if os.path.isfile(os.path.join(static_dir, filename + PRECOMPRESSED_SUFFIXES[encoding]))]
+    encoding = accept_encodings.best_match(candidates) if candidates else None
+    if encoding is None:
+        return None, None
+    return filename + PRECOMPRESSED_SUFFIXES[encoding], encoding
+
+
+if __name__ == '__main__':
+    # Precompress static text assets at deploy time: python compression.py
+    count = precompress_static()
+    print(f"Wrote {count} precompressed files" + ('' if BROTLI_AVAILABLE else ' (gzip only; install Brotli for .br)'))
@@ -1,143 +1,1024 @@
 import sqlite3
 import json
 from datetime import datetime, timedelta
-import hashlib
-import secrets
+import os
+import time
+import queue
+import threading
+import atexit
+from concurrent.futures import Future
+
+from passwords import hasher_from_env
+
+class SlotUnavailable(Exception):
+    """Raised when a booking asks for a time slot that is closed or already full"""
+
+class ConnectionPool:
+    """Pool of SQLite connections, checked out once per thread.
+    
+    Checkouts never wait: a thread gets an idle connection or a new one, and at most
+    max_idle connections are kept open between checkouts. The writer thread has its own
+    connection outside the pool, and background threads release theirs after each pass.
+    """
+    
+    def __init__(self, connect, max_idle=8):
+        self._connect = connect
+        self.max_idle = max_idle
+        self._reset()
+    
+    def _reset(self):
+        """Start with an empty pool owned by the current process"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._idle = []
+        self._in_use = 0
+        self._stats = {
+            'created': 0,      # new sqlite3 connections opened
+            'reused': 0,       # idle connections handed out again
+            'thread_hits': 0,  # repeat checkouts within one request/thread
+            'discarded': 0,    # connections that failed the health check
+            'overflow': 0      # released connections closed because max_idle were already idle
+        }
+    
+    def _check_fork(self):
+        # Connections must never be shared with a forked child (gunicorn --preload)
+        if os.getpid() != self._pid:
+            self._reset()
+    
+    def _is_healthy(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def acquire(self):
+        """Return the current thread's connection, checking one out if needed"""
+        self._check_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                self._stats['thread_hits'] += 1
+            return conn
+        
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                break
+            if self._is_healthy(conn):
+                with self._lock:
+                    self._stats['reused'] += 1
+                break
+            with self._lock:
+                self._stats['discarded'] += 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self._stats['created'] += 1
+        
+        with self._lock:
+            self._in_use += 1
+        self._local.conn = conn
+        return conn
+    
+    def release(self):
+        """Hand the current thread's connection back to the pool"""
+        self._check_fork()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        
+        try:
+            # Never hand an open transaction to the next request
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn = None
+        
+        with self._lock:
+            self._in_use -= 1
+            if conn is not None and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            if conn is not None:
+                self._stats['overflow'] += 1
+            else:
+                self._stats['discarded'] += 1
+        if conn is not None:
+            conn.close()
+    
+    def close_all(self):
+        """Close every idle connection"""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+    
+    def get_stats(self):
+        """Counters describing how connections are being reused"""
+        self._check_fork()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._in_use
+        stats['max_idle'] = self.max_idle
+        stats['pid'] = self._pid
+        return stats
+
+class WriteQueue:
+    """Single writer thread that applies queued writes in batched transactions"""
+    
+    _STOP = object()
+    
+    def __init__(self, connect, batch_size=64, lock_retries=3, on_lock_retry=None):
+        self._connect = connect
+        self.batch_size = batch_size
+        self.lock_retries = lock_retries
+        self.on_lock_retry = on_lock_retry
+        self._reset()
+    
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = False
+        self._stats = {
+            'submitted': 0,
+            'batches': 0,
+            'committed': 0,
+            'failed': 0,
+            'lock_retries': 0
+        }
+    
+    def _ensure_started(self):
+        # The writer thread does not survive a fork, so each worker starts its own
+        if os.getpid() != self._pid:
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('Write queue has been stopped')
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+    
+    def submit(self, fn):
+        """Queue fn(cursor) for the writer thread and return a Future for its result"""
+        self._ensure_started()
+        future = Future()
+        with self._lock:
+            self._stats['submitted'] += 1
+        self._queue.put((fn, future))
+        return future
+    
+    def run(self, fn):
+        """Queue fn(cursor) and wait for it to be committed"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('Writes cannot be queued from inside another write')
+        return self.submit(fn).result()
+    
+    def _run(self):
+        conn = self._connect(isolation_level=None)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                batch = [item]
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                self._apply(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+    
+    def _begin(self, conn):
+        # busy_timeout already waits for other processes; retry a few more times on top
+        for attempt in range(self.lock_retries + 1):
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                if attempt == self.lock_retries:
+                    raise
+                with self._lock:
+                    self._stats['lock_retries'] += 1
+                if self.on_lock_retry is not None:
+                    self.on_lock_retry()
+                time.sleep(0.05 * (attempt + 1))
+    
+    def _apply(self, conn, batch):
+        """Run a batch inside one transaction, isolating each write in a savepoint"""
+        try:
+            self._begin(conn)
+        except sqlite3.Error as e:
+            for _, future in batch:
+                future.set_exception(e)
+            with self._lock:
+                self._stats['failed'] += len(batch)
+            return
+        
+        results = []
+        for fn, future in batch:
+            cursor = conn.cursor()
+            cursor.execute('SAVEPOINT queued_write')
+            try:
+                result = fn(cursor)
+                cursor.execute('RELEASE queued_write')
+                results.append((future, result, None))
+            except Exception as e:
+                if conn.in_transaction:
+                    cursor.execute('ROLLBACK TO queued_write')
+                    cursor.execute('RELEASE queued_write')
+                results.append((future, None, e))
+        
+        try:
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            results = [(future, None, e) for future, _, _ in results]
+        
+        failed = 0
+        for future, result, error in results:
+            if error is not None:
+                failed += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['committed'] += len(results) - failed
+            self._stats['failed'] += failed
+    
+    def stop(self):
+        """Flush queued writes and stop the writer thread"""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join(timeout=10)
+    
+    def get_stats(self):
+        """Counters describing queued write throughput"""
+        if os.getpid() != self._pid:
+            self._reset()
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+class AccessLogBuffer:
+    """Bounded buffer of access-log rows, inserted with executemany by the writer thread.
+    
+    Rows are flushed once flush_size of them are waiting or every flush_interval seconds.
+    When max_size rows are already buffered or queued on the writer and not yet committed,
+    new ones are dropped and counted instead of blocking the request thread or growing the
+    writer's backlog.
+    """
+    
+    def __init__(self, writer, flush_size=100, flush_interval=1.0, max_size=10000):
+        self.writer = writer
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._reset()
+    
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._rows = []
+        self._in_flight = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._stats = {
+            'buffered': 0,
+            'written': 0,
+            'dropped': 0,
+            'flushes': 0
+        }
+    
+    def _ensure_started(self):
+        # Like the writer thread, the flush timer does not survive a fork
+        if os.getpid() != self._pid:
+            self._reset()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if not self._stopped and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='access-log-flush', daemon=True)
+                self._thread.start()
+    
+    def add(self, row):
+        """Buffer one row; returns False if it was dropped because the buffer is full"""
+        self._ensure_started()
+        with self._lock:
+            if self._stopped or len(self._rows) + self._in_flight >= self.max_size:
+                self._stats['dropped'] += 1
+                return False
+            self._rows.append(row)
+            self._stats['buffered'] += 1
+            full = len(self._rows) >= self.flush_size
+        if full:
+            self.flush()
+        return True
+    
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self.flush()
+    
+    def flush(self, wait=False):
+        """Hand the buffered rows to the writer thread, optionally waiting for the commit"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._in_flight += len(rows)
+        if not rows:
+            return
+        
+        def write(cursor):
+            cursor.executemany('''
+                INSERT INTO access_logs (username, ip_address, user_agent, action, success, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+        
+        def done(future):
+            with self._lock:
+                self._in_flight -= len(rows)
+                if future.exception() is None:
+                    self._stats['written'] += len(rows)
+                    self._stats['flushes'] += 1
+                else:
+                    self._stats['dropped'] += len(rows)
+        
+        try:
+            future = self.writer.submit(write)
+        except RuntimeError:
+            with self._lock:
+                self._in_flight -= len(rows)
+                self._stats['dropped'] += len(rows)
+            return
+        future.add_done_callback(done)
+        if wait:
+            try:
+                future.result()
+            except sqlite3.Error as e:
+                print(f"Access log flush failed: {e}")
+    
+    def stop(self):
+        """Stop the flush timer and hand over whatever is still buffered"""
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+        self._wakeup.set()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=10)
+        self.flush()
+    
+    def get_stats(self):
+        if os.getpid() != self._pid:
+            self._reset()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._rows)
+            stats['in_flight'] = self._in_flight
+        return stats
+
+class GenerationCache:
+    """Read-through cache whose entries expire by TTL or when their table's generation moves on"""
+    
+    def __init__(self, load_generations, ttl=300, check_interval=1.0):
+        self._load_generations = load_generations
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generations = {}
+        self._checked_at = None
+        self._stats = {'hits': 0, 'misses': 0, 'generation_checks': 0}
+    
+    def generations(self):
+        """Current generation per table, re-read from SQLite at most once per check interval"""
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is None or now - checked_at >= self.check_interval:
+            generations = self._load_generations()
+            with self._lock:
+                self._generations = generations
+                self._checked_at = now
+                self._stats['generation_checks'] += 1
+        return self._generations
+    
+    def get(self, key, table, loader):
+        """Return the cached value for key, calling loader() on a miss"""
+        generation = self.generations().get(table, 0)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == generation and entry[1] > now:
+            with self._lock:
+                self._stats['hits'] += 1
+            return entry[2]
+        
+        value = loader()
+        with self._lock:
+            self._stats['misses'] += 1
+            self._entries[key] = (generation, now + self.ttl, value)
+        return value
+    
+    def invalidate(self):
+        """Force the next lookup to re-read generations (called after local writes)"""
+        self._checked_at = None
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['generations'] = dict(self._generations)
+        return stats
+
+class ObservedCursor(sqlite3.Cursor):
+    """Cursor that reports how long each execute and fetch takes to its connection's observer"""
+    
+    def _observe(self, statement, executed, call, *args):
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self.connection.observer.query(statement, time.perf_counter() - started, executed)
+    
+    def execute(self, sql, parameters=()):
+        self._statement = sql
+        return self._observe(sql, True, super().execute, sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._statement = sql
+        return self._observe(sql, True, super().executemany, sql, seq_of_parameters)
+    
+    def fetchone(self):
+        return self._observe(getattr(self, '_statement', None), False, super().fetchone)
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        return self._observe(getattr(self, '_statement', None), False, super().fetchmany, size)
+    
+    def fetchall(self):
+        return self._observe(getattr(self, '_statement', None), False, super().fetchall)
+
+class ObservedConnection(sqlite3.Connection):
+    """Connection whose cursors are ObservedCursors; observer is set by DatabaseManager._connect"""
+    observer = None
+    
+    def cursor(self, factory=ObservedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+# Booking fields the API can return, mapped to the SQL that selects them
+BOOKING_FIELDS = {
+    'id': 'b.id',
+    'service_id': 'b.service_id',
+    'customer_name': 'b.customer_name',
+    'customer_phone': 'b.customer_phone',
+    'customer_email': 'b.customer_email',
+    'customer_address': 'b.customer_address',
+    'service_date': 'b.service_date',
+    'time_slot': 'b.time_slot',
+    'description': 'b.description',
+    'total_price': 'b.total_price',
+    'status': 'b.status',
+    'created_at': 'b.created_at',
+    'service_name': 's.name'
+}
+
+# Spacing between photo display_order values, so a move only rewrites the moved photo
+GALLERY_ORDER_GAP = 1024
+
+# Applied to every connection opened by DatabaseManager
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',     # readers never block on the writer
+    'synchronous': 'NORMAL',   # safe with WAL, one fsync per checkpoint instead of per commit
+    'busy_timeout': 10000,     # milliseconds to wait on another process holding the lock
+    'cache_size': -16000,      # negative values are KiB, so 16 MB of page cache
+    'mmap_size': 134217728,    # 128 MB memory-mapped reads
+    'temp_store': 'MEMORY'
+}
 
 class DatabaseManager:
-    def __init__(self, db_path='bolder_electric.db'):
+    def __init__(self, db_path='bolder_electric.db', max_idle_connections=8, pragmas=None, write_batch_size=64,
+                 cache_ttl=300, generation_check_interval=1.0, password_hasher=None, observer=None):
         self.db_path = db_path
+        # Optional timing hooks: query(statement, seconds, executed), connection(seconds), write(seconds),
+        # lock_retry()
+        self.observer = observer
+        self.hasher = password_hasher or hasher_from_env()
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.pragmas.update(pragmas or {})
+        self.pool = ConnectionPool(self._connect, max_idle=max_idle_connections)
+        self.writer = WriteQueue(self._connect, batch_size=write_batch_size,
+                                 on_lock_retry=observer.lock_retry if observer is not None else None)
+        self.access_log = AccessLogBuffer(self.writer)
+        self.cache = GenerationCache(self._load_generations, ttl=cache_ttl,
+                                     check_interval=generation_check_interval)
+        atexit.register(self.close)
         self.init_database()
+        self.release_connection()
+    
+    def _connect(self, isolation_level=''):
+        """Open a new SQLite connection with the configured PRAGMAs applied"""
+        # Pooled connections may be checked out by a different thread later on
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas.get('busy_timeout', 10000) / 1000.0,
+            check_same_thread=False,
+            isolation_level=isolation_level,
+            factory=sqlite3.Connection if self.observer is None else ObservedConnection
+        )
+        if self.observer is not None:
+            conn.observer = self.observer
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}').fetchall()
+        return conn
+    
+    def close(self):
+        """Flush pending writes and close pooled connections"""
+        self.access_log.stop()
+        self.writer.stop()
+        self.pool.close_all()
     
     def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        """Get the pooled database connection for the current thread"""
+        if self.observer is None:
+            return self.pool.acquire()
+        started = time.perf_counter()
+        conn = self.pool.acquire()
+        self.observer.connection(time.perf_counter() - started)
         return conn
     
-    def init_database(self):
-        """Initialize the database with required tables"""
+    def release_connection(self):
+        """Return the current thread's connection to the pool"""
+        self.pool.release()
+    
+    def get_pool_stats(self):
+        """Get connection pool counters"""
+        return self.pool.get_stats()
+    
+    def run_write(self, fn):
+        """Run fn(cursor) on the single writer thread and return its result"""
+        if self.observer is None:
+            return self.writer.run(fn)
+        started = time.perf_counter()
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Admin users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS admin_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    salt TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP,
-                    failed_attempts INTEGER DEFAULT 0,
-                    locked_until TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1
-                )
-            ''')
-            
-            # Access logs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS access_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT,
-                    ip_address TEXT,
-                    user_agent TEXT,
-                    action TEXT,
-                    success BOOLEAN,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Contact info table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS contact_info (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    phone TEXT NOT NULL,
-                    email TEXT NOT NULL,
-                    address TEXT NOT NULL,
-                    service_area TEXT NOT NULL,
-                    business_hours TEXT NOT NULL,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Services table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS services (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    base_price REAL NOT NULL,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Time slots table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS time_slots (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    time_slot TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Availability table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS availability (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    date DATE NOT NULL,
-                    time_slot_id INTEGER,
-                    is_available BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (time_slot_id) REFERENCES time_slots (id)
-                )
-            ''')
-            
-            # Bookings table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS bookings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    service_id INTEGER,
-                    customer_name TEXT NOT NULL,
-                    customer_phone TEXT NOT NULL,
-                    customer_email TEXT NOT NULL,
-                    customer_address TEXT NOT NULL,
-                    service_date DATE NOT NULL,
-                    time_slot TEXT NOT NULL,
-                    description TEXT,
-                    total_price REAL NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (service_id) REFERENCES services (id)
-                )
-            ''')
-            
-            # Gallery photos table
+            return self.writer.run(fn)
+        finally:
+            self.observer.write(time.perf_counter() - started)
+    
+    def get_write_stats(self):
+        """Get write queue counters"""
+        return self.writer.get_stats()
+    
+    def get_access_log_stats(self):
+        """Get access-log buffer counters"""
+        return self.access_log.get_stats()
+    
+    def _load_generations(self):
+        """Read every table generation in one query"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, generation FROM cache_generations')
+        return dict(cursor.fetchall())
+    
+    def _bump_generation(self, cursor, *tables):
+        """Advance table generations inside a write so every worker drops its cached copies"""
+        cursor.executemany('''
+            INSERT INTO cache_generations (name, generation) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET generation = generation + 1
+        ''', [(table,) for table in tables])
+    
+    def run_cached_write(self, fn, *tables):
+        """Run a write that changes cached tables and invalidate them once it commits"""
+        def write(cursor):
+            result = fn(cursor)
+            self._bump_generation(cursor, *tables)
+            return result
+        try:
+            return self.run_write(write)
+        finally:
+            self.cache.invalidate()
+    
+    def get_generations(self):
+        """Get the current generation of each cached table"""
+        return dict(self.cache.generations())
+    
+    def get_cache_stats(self):
+        """Get read cache counters"""
+        return self.cache.get_stats()
+    
+    def get_cached_page(self, cache_key, encoding=''):
+        """Get (etag, content_type, body) of a rendered page, or None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT etag, content_type, body FROM page_cache WHERE cache_key = ? AND encoding = ?
+        ''', (cache_key, encoding))
+        return cursor.fetchone()
+    
+    def store_cached_page(self, cache_key, route, etag, content_type, body, encoding=''):
+        """Store a rendered page, dropping older renders of the same route"""
+        def write(cursor):
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS gallery_photos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    filename TEXT NOT NULL,
-                    title TEXT,
-                    description TEXT,
-                    category TEXT DEFAULT 'general',
-                    display_order INTEGER DEFAULT 0,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+                INSERT OR REPLACE INTO page_cache (cache_key, encoding, route, etag, content_type, body)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (cache_key, encoding, route, etag, content_type, body))
+            cursor.execute('DELETE FROM page_cache WHERE route = ? AND cache_key != ?', (route, cache_key))
+        self.run_write(write)
+    
+    def clear_page_cache(self):
+        """Drop every rendered page"""
+        def write(cursor):
+            cursor.execute('DELETE FROM page_cache')
+        self.run_write(write)
+    
+    def init_database(self):
+        """Create or upgrade the schema, then seed default data"""
+        try:
+            self.migrate()
             self.seed_default_data()
         except Exception as e:
             print(f"Database initialization error: {e}")
             raise
     
+    def migrations(self):
+        """Schema migrations as (version, description, function) in the order they apply"""
+        return [
+            (1, 'Initial schema', self._migrate_initial_schema),
+            (2, 'Indexes for the hot queries', self._migrate_query_indexes),
+            (3, 'Slot reservations', self._migrate_slot_reservations),
+            (4, 'One availability row per date and time slot', self._migrate_unique_availability),
+            (5, 'Closed time slot bitmaps', self._migrate_slot_bitmaps),
+            (6, 'Access log rollups', self._migrate_access_log_rollups),
+            (7, 'Slot bitmaps keyed by time slot position', self._rebuild_slot_bitmaps)
+        ]
+    
+    def migrate(self):
+        """Apply pending migrations, recording the schema version in PRAGMA user_version.
+        
+        Each migration runs in its own BEGIN IMMEDIATE transaction, so a failure leaves the
+        schema at the previous version and workers starting together apply it only once.
+        """
+        conn = self._connect(isolation_level=None)
+        try:
+            for version, description, migration in self.migrations():
+                if self.get_schema_version(conn) >= version:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Another worker may have applied it while we waited for the lock
+                    if self.get_schema_version(conn) < version:
+                        migration(conn.cursor())
+                        conn.execute(f'PRAGMA user_version = {int(version)}')
+                        print(f"Applied migration {version}: {description}")
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        finally:
+            conn.close()
+    
+    def get_schema_version(self, conn=None):
+        """Schema version of the database file (the last migration applied)"""
+        conn = conn or self.get_connection()
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def _migrate_initial_schema(self, cursor):
+        # Databases from before versioned migrations may already have any of these,
+        # so every statement here must be idempotent
+        
+        # Admin users table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS admin_users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                salt TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_login TIMESTAMP,
+                failed_attempts INTEGER DEFAULT 0,
+                locked_until TIMESTAMP,
+                is_active BOOLEAN DEFAULT 1
+            )
+        ''')
+        
+        # Access logs table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS access_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT,
+                ip_address TEXT,
+                user_agent TEXT,
+                action TEXT,
+                success BOOLEAN,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Contact info table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS contact_info (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phone TEXT NOT NULL,
+                email TEXT NOT NULL,
+                address TEXT NOT NULL,
+                service_area TEXT NOT NULL,
+                business_hours TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Services table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS services (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                description TEXT,
+                base_price REAL NOT NULL,
+                is_active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Time slots table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS time_slots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                time_slot TEXT NOT NULL,
+                is_active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Availability table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS availability (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date DATE NOT NULL,
+                time_slot_id INTEGER,
+                is_available BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (time_slot_id) REFERENCES time_slots (id)
+            )
+        ''')
+        
+        # Bookings table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS bookings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                service_id INTEGER,
+                customer_name TEXT NOT NULL,
+                customer_phone TEXT NOT NULL,
+                customer_email TEXT NOT NULL,
+                customer_address TEXT NOT NULL,
+                service_date DATE NOT NULL,
+                time_slot TEXT NOT NULL,
+                description TEXT,
+                total_price REAL NOT NULL,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (service_id) REFERENCES services (id)
+            )
+        ''')
+        
+        # Gallery photos table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_photos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                filename TEXT NOT NULL,
+                title TEXT,
+                description TEXT,
+                category TEXT DEFAULT 'general',
+                display_order INTEGER DEFAULT 0,
+                is_active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                variants TEXT
+            )
+        ''')
+        # Databases created before responsive images lack the variants column
+        self._add_column_if_missing(cursor, 'gallery_photos', 'variants', 'TEXT')
+        # SHA-256 of the upload; NULL for photos stored by name before content addressing
+        self._add_column_if_missing(cursor, 'gallery_photos', 'content_hash', 'TEXT')
+        
+        # Gallery blobs table - one row per distinct upload, shared by duplicate photos
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS gallery_blobs (
+                sha256 TEXT PRIMARY KEY,
+                extension TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                variants TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                unreferenced_at TIMESTAMP
+            )
+        ''')
+        
+        # Outbound email queue - drained by the background sender in mail_queue.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbound_emails (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                message TEXT NOT NULL,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                claimed_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                sent_at TIMESTAMP
+            )
+        ''')
+        
+        # Image processing jobs - drained by the worker pool in image_jobs.py
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS image_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                photo_id INTEGER NOT NULL,
+                source_path TEXT NOT NULL,
+                status TEXT DEFAULT 'queued',
+                attempts INTEGER DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (photo_id) REFERENCES gallery_photos (id)
+            )
+        ''')
+        
+        # Rendered public pages shared by all workers - keyed by route and data generations
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS page_cache (
+                cache_key TEXT NOT NULL,
+                encoding TEXT NOT NULL DEFAULT '',
+                route TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                body BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (cache_key, encoding)
+            )
+        ''')
+        
+        # Cache generations table - bumped whenever a cached table changes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cache_generations (
+                name TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+    
+    def _migrate_query_indexes(self, cursor):
+        # Admin access log, newest first
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_access_logs_timestamp ON access_logs (timestamp)')
+        # get_availability looks up one (date, time slot) per active slot
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_availability_date_slot
+            ON availability (date, time_slot_id, is_available)
+        ''')
+        # Keyset pagination of bookings walks (service_date, time_slot, id), optionally
+        # after an equality filter on status or service
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_date_slot ON bookings (service_date, time_slot, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_status_date ON bookings (status, service_date, time_slot, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bookings_service_date ON bookings (service_id, service_date, time_slot, id)')
+        # Only active photos are ever listed, so the gallery indexes skip deleted ones
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_gallery_photos_active_order
+            ON gallery_photos (display_order) WHERE is_active = 1
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_gallery_photos_active_category
+            ON gallery_photos (category, display_order) WHERE is_active = 1
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_gallery_photos_content_hash ON gallery_photos (content_hash)')
+        # Garbage collection only looks at blobs nothing references
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_gallery_blobs_unreferenced
+            ON gallery_blobs (unreferenced_at) WHERE ref_count <= 0
+        ''')
+        # Queue workers claim by status; stats group by it
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbound_emails_status ON outbound_emails (status, next_attempt_at)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_status ON image_jobs (status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_jobs_photo ON image_jobs (photo_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_cache_route ON page_cache (route)')
+    
+    def _migrate_slot_reservations(self, cursor):
+        # How many bookings (crews) a time slot takes at once
+        self._add_column_if_missing(cursor, 'time_slots', 'capacity', 'INTEGER NOT NULL DEFAULT 1')
+        # One row per occupied seat; the primary key is what stops a slot being overbooked
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS slot_reservations (
+                service_date DATE NOT NULL,
+                time_slot TEXT NOT NULL,
+                seat INTEGER NOT NULL,
+                booking_id INTEGER NOT NULL UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (service_date, time_slot, seat),
+                FOREIGN KEY (booking_id) REFERENCES bookings (id)
+            ) WITHOUT ROWID
+        ''')
+        # Existing bookings keep their slots, even where two were already double-booked
+        cursor.execute('''
+            INSERT OR IGNORE INTO slot_reservations (service_date, time_slot, seat, booking_id)
+            SELECT service_date, time_slot,
+                   ROW_NUMBER() OVER (PARTITION BY service_date, time_slot ORDER BY id) - 1, id
+            FROM bookings
+            WHERE status != 'cancelled'
+        ''')
+    
+    def _migrate_unique_availability(self, cursor):
+        # INSERT OR REPLACE without a unique key added a row per change; the newest one won
+        cursor.execute('''
+            DELETE FROM availability
+            WHERE id NOT IN (SELECT MAX(id) FROM availability GROUP BY date, time_slot_id)
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_availability_unique_date_slot
+            ON availability (date, time_slot_id)
+        ''')
+    
+    def _migrate_slot_bitmaps(self, cursor):
+        # Bit n of closed_mask is set while the nth time slot by id is closed or full that day;
+        # days where every slot is open have no row
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS slot_bitmaps (
+                date DATE PRIMARY KEY,
+                closed_mask INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        self._rebuild_slot_bitmaps(cursor)
+    
+    def _migrate_access_log_rollups(self, cursor):
+        # /api/logs?action= pages through one action newest first
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_access_logs_action_timestamp ON access_logs (action, timestamp)
+        ''')
+        # What is left of access_logs rows once they are archived and pruned
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS access_log_daily (
+                day DATE NOT NULL,
+                action TEXT NOT NULL,
+                success BOOLEAN NOT NULL,
+                ip_address TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                first_seen TIMESTAMP NOT NULL,
+                last_seen TIMESTAMP NOT NULL,
+                PRIMARY KEY (day, action, success, ip_address)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _add_column_if_missing(self, cursor, table, column, definition):
+        """Add a column to an existing table if an older schema doesn't have it yet"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
     def seed_default_data(self):
         """Seed default services and time slots"""
+        conn = None
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
@@ -197,43 +1078,32 @@ class DatabaseManager:
                 print("Created time slots")
             
             conn.commit()
-            conn.close()
         except Exception as e:
             print(f"Seeding error: {e}")
             if conn:
-                conn.close()
+                conn.rollback()
     
     def hash_password(self, password, salt=None):
-        """Hash password with salt using SHA-256"""
-        if salt is None:
-            salt = secrets.token_hex(32)
-        
-        password_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-        return password_hash, salt
+        """Hash password with salt using the configured KDF; returns (encoded hash, salt)"""
+        return self.hasher.hash(password, salt)
     
     def create_admin_user(self, username, password):
         """Create admin user with hashed password"""
         password_hash, salt = self.hash_password(password)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO admin_users (username, password_hash, salt)
-            VALUES (?, ?, ?)
-        ''', (username, password_hash, salt))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO admin_users (username, password_hash, salt)
+                VALUES (?, ?, ?)
+            ''', (username, password_hash, salt))
+        self.run_write(write)
     
     def verify_admin_login(self, username, password, ip_address, user_agent):
         """Verify admin login credentials with security checks"""
-        conn = None
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
             
-            # Log the attempt
-            success = False
-            
             cursor.execute('''
                 SELECT id, password_hash, salt, failed_attempts, locked_until, is_active
                 FROM admin_users 
@@ -243,6 +1113,7 @@ class DatabaseManager:
             user = cursor.fetchone()
             
             if not user:
+                self.hasher.dummy_verify(password)
                 self.log_access(username, ip_address, user_agent, 'login_attempt', False)
                 return False, "Invalid credentials"
             
@@ -259,145 +1130,203 @@ class DatabaseManager:
                 return False, "Account is disabled"
             
             # Verify password
-            password_hash, _ = self.hash_password(password, salt)
+            matches, needs_rehash = self.hasher.verify(password, salt, stored_hash)
             
-            if password_hash == stored_hash:
-                # Successful login - reset failed attempts
-                cursor.execute('''
-                    UPDATE admin_users 
-                    SET failed_attempts = 0, last_login = CURRENT_TIMESTAMP, locked_until = NULL
-                    WHERE id = ?
-                ''', (user_id,))
-                success = True
-                self.log_access(username, ip_address, user_agent, 'login_success', True)
-            else:
-                # Failed login - increment failed attempts
-                failed_attempts += 1
-                cursor.execute('''
-                    UPDATE admin_users 
-                    SET failed_attempts = ?
-                    WHERE id = ?
-                ''', (failed_attempts, user_id))
-                
-                # Lock account after 5 failed attempts for 30 minutes
-                if failed_attempts >= 5:
-                    lock_until = (datetime.now() + timedelta(minutes=30)).isoformat()
+            if matches:
+                # Successful login - reset failed attempts, and upgrade an old or cheaper hash
+                # now that we have the plain password
+                new_hash = self.hash_password(password) if needs_rehash else None
+                def write(cursor):
                     cursor.execute('''
                         UPDATE admin_users 
-                        SET locked_until = ?
+                        SET failed_attempts = 0, last_login = CURRENT_TIMESTAMP, locked_until = NULL
                         WHERE id = ?
-                    ''', (lock_until, user_id))
-                
-                self.log_access(username, ip_address, user_agent, 'login_failed', False)
-            
-            conn.commit()
-            
-            if success:
+                    ''', (user_id,))
+                    if new_hash:
+                        cursor.execute('''
+                            UPDATE admin_users SET password_hash = ?, salt = ? WHERE id = ?
+                        ''', (new_hash[0], new_hash[1], user_id))
+                self.run_write(write)
+                self.log_access(username, ip_address, user_agent, 'login_success', True)
                 return True, "Login successful"
-            else:
-                return False, "Invalid credentials"
+            
+            # Failed login - increment failed attempts and lock the account
+            # after 5 failed attempts for 30 minutes
+            lock_until = (datetime.now() + timedelta(minutes=30)).isoformat()
+            def write(cursor):
+                cursor.execute('''
+                    UPDATE admin_users 
+                    SET failed_attempts = failed_attempts + 1,
+                        locked_until = CASE WHEN failed_attempts + 1 >= 5 THEN ? ELSE locked_until END
+                    WHERE id = ?
+                ''', (lock_until, user_id))
+            # Not waited for: during a burst the writer commits these counts in batches
+            try:
+                self.writer.submit(write)
+            except RuntimeError:
+                pass
+            self.log_access(username, ip_address, user_agent, 'login_failed', False)
+            return False, "Invalid credentials"
                 
         except sqlite3.Error as e:
-            if conn:
-                conn.rollback()
             return False, f"Database error: {str(e)}"
-        finally:
-            if conn:
-                conn.close()
     
     def log_access(self, username, ip_address, user_agent, action, success):
-        """Log access attempts - simplified to avoid blocking"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO access_logs (username, ip_address, user_agent, action, success)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (username, ip_address, user_agent, action, success))
-            conn.commit()
-            conn.close()
-        except sqlite3.Error:
-            pass  # Don't fail if logging fails
+        """Buffer an access-log row; it is inserted with the next batch"""
+        # Stamped now in CURRENT_TIMESTAMP's format, since the insert happens later
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        self.access_log.add((username, ip_address, user_agent, action, success, timestamp))
     
-    def get_access_logs(self, limit=100):
-        """Get access logs"""
-        conn = sqlite3.connect(self.db_path)
+    def get_access_logs(self, limit=100, action=None, since=None, until=None, before=None):
+        """Get access logs newest first, optionally for one action and a time range.
+        
+        Rows are (username, ip_address, action, success, timestamp, id); pass the
+        (timestamp, id) of the last row as before to get the next page.
+        """
+        # Include this worker's buffered rows, e.g. the login that just happened
+        self.access_log.flush(wait=True)
+        conditions = []
+        params = []
+        if action:
+            conditions.append('action = ?')
+            params.append(action)
+        if since:
+            conditions.append('timestamp >= ?')
+            params.append(since)
+        if until:
+            conditions.append('timestamp < ?')
+            params.append(until)
+        if before:
+            conditions.append('(timestamp, id) < (?, ?)')
+            params.extend(before)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT username, ip_address, action, success, timestamp
-            FROM access_logs 
-            ORDER BY timestamp DESC 
+        cursor.execute(f'''
+            SELECT username, ip_address, action, success, timestamp, id
+            FROM access_logs
+            {where}
+            ORDER BY timestamp DESC, id DESC
             LIMIT ?
-        ''', (limit,))
+        ''', params + [limit])
         logs = cursor.fetchall()
-        conn.close()
         return logs
     
+    def get_expired_access_logs(self, cutoff, limit=5000):
+        """Oldest access-log rows from before cutoff, as full rows for archiving"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, username, ip_address, user_agent, action, success, timestamp
+            FROM access_logs
+            WHERE timestamp < ?
+            ORDER BY timestamp, id
+            LIMIT ?
+        ''', (cutoff, limit))
+        return cursor.fetchall()
+    
+    def rollup_access_logs(self, cutoff, through):
+        """Fold rows before cutoff up to (timestamp, id) through into daily counts and delete them.
+        
+        Returns the number of rows removed from access_logs.
+        """
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO access_log_daily (day, action, success, ip_address, attempts, first_seen, last_seen)
+                SELECT date(timestamp), COALESCE(action, ''), COALESCE(success, 0), COALESCE(ip_address, ''),
+                       COUNT(*), MIN(timestamp), MAX(timestamp)
+                FROM access_logs
+                WHERE timestamp < ? AND (timestamp, id) <= (?, ?)
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (day, action, success, ip_address) DO UPDATE SET
+                    attempts = attempts + excluded.attempts,
+                    first_seen = MIN(first_seen, excluded.first_seen),
+                    last_seen = MAX(last_seen, excluded.last_seen)
+            ''', (cutoff, through[0], through[1]))
+            cursor.execute('''
+                DELETE FROM access_logs WHERE timestamp < ? AND (timestamp, id) <= (?, ?)
+            ''', (cutoff, through[0], through[1]))
+            return cursor.rowcount
+        return self.run_write(write)
+    
+    def get_access_log_rollups(self, start_day, end_day, action=None):
+        """Daily access counts as (day, action, success, ip_address, attempts, first_seen, last_seen)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        query = '''
+            SELECT day, action, success, ip_address, attempts, first_seen, last_seen
+            FROM access_log_daily
+            WHERE day BETWEEN ? AND ?
+        '''
+        params = [start_day, end_day]
+        if action:
+            query += ' AND action = ?'
+            params.append(action)
+        cursor.execute(query + ' ORDER BY day DESC, action, success, ip_address', params)
+        return cursor.fetchall()
+    
     def update_admin_password(self, username, new_password):
         """Update admin password"""
         password_hash, salt = self.hash_password(new_password)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE admin_users 
-            SET password_hash = ?, salt = ?, failed_attempts = 0, locked_until = NULL
-            WHERE username = ?
-        ''', (password_hash, salt, username))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute('''
+                UPDATE admin_users 
+                SET password_hash = ?, salt = ?, failed_attempts = 0, locked_until = NULL
+                WHERE username = ?
+            ''', (password_hash, salt, username))
+        self.run_write(write)
     
     def get_contact_info(self):
         """Get contact information"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT phone, email, address, service_area, business_hours FROM contact_info LIMIT 1')
-        contact = cursor.fetchone()
-        conn.close()
-        return contact
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT phone, email, address, service_area, business_hours FROM contact_info LIMIT 1')
+            return cursor.fetchone()
+        return self.cache.get('contact_info', 'contact_info', load)
     
     def update_contact_info(self, phone, email, address, service_area, business_hours):
         """Update contact information"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO contact_info (id, phone, email, address, service_area, business_hours)
-            VALUES (1, ?, ?, ?, ?, ?)
-        ''', (phone, email, address, service_area, business_hours))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute('''
+                INSERT OR REPLACE INTO contact_info (id, phone, email, address, service_area, business_hours)
+                VALUES (1, ?, ?, ?, ?, ?)
+            ''', (phone, email, address, service_area, business_hours))
+        self.run_cached_write(write, 'contact_info')
     
     def get_services(self):
         """Get all active services"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, name, description, base_price 
-            FROM services 
-            WHERE is_active = 1 
-            ORDER BY name
-        ''')
-        services = cursor.fetchall()
-        conn.close()
-        return services
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, name, description, base_price 
+                FROM services 
+                WHERE is_active = 1 
+                ORDER BY name
+            ''')
+            return tuple(cursor.fetchall())
+        return list(self.cache.get('services', 'services', load))
     
     def get_time_slots(self):
         """Get all active time slots"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, time_slot 
-            FROM time_slots 
-            WHERE is_active = 1 
-            ORDER BY time_slot
-        ''')
-        time_slots = cursor.fetchall()
-        conn.close()
-        return time_slots
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, time_slot 
+                FROM time_slots 
+                WHERE is_active = 1 
+                ORDER BY time_slot
+            ''')
+            return tuple(cursor.fetchall())
+        return list(self.cache.get('time_slots', 'time_slots', load))
     
     def get_availability(self, date):
         """Get availability for a specific date"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT ts.id, ts.time_slot, a.is_available
@@ -407,133 +1336,470 @@ class DatabaseManager:
             ORDER BY ts.time_slot
         ''', (date,))
         availability = cursor.fetchall()
-        conn.close()
         return availability
     
-    def set_availability(self, date, time_slot_id, is_available):
-        """Set availability for a specific date and time slot"""
-        conn = sqlite3.connect(self.db_path)
+    def _slot_positions(self, cursor):
+        # Bits follow the slots' order by id rather than the ids themselves, so AUTOINCREMENT
+        # gaps can't push a bit past SQLite's 64-bit INTEGER
+        cursor.execute('SELECT id FROM time_slots ORDER BY id')
+        return {time_slot_id: position for position, (time_slot_id,) in enumerate(cursor.fetchall())}
+    
+    def _refresh_slot_bitmaps(self, cursor, dates):
+        """Recompute the closed-slot bitmap of each date inside the current write"""
+        positions = self._slot_positions(cursor)
+        for date in set(dates):
+            cursor.execute('''
+                SELECT ts.id FROM time_slots ts
+                WHERE EXISTS (
+                        SELECT 1 FROM availability a
+                        WHERE a.date = ? AND a.time_slot_id = ts.id AND a.is_available = 0
+                    )
+                    OR (
+                        SELECT COUNT(*) FROM slot_reservations r
+                        WHERE r.service_date = ? AND r.time_slot = ts.time_slot
+                    ) >= ts.capacity
+            ''', (date, date))
+            closed_mask = 0
+            for (time_slot_id,) in cursor.fetchall():
+                closed_mask |= 1 << positions[time_slot_id]
+            if closed_mask:
+                cursor.execute('''
+                    INSERT INTO slot_bitmaps (date, closed_mask) VALUES (?, ?)
+                    ON CONFLICT (date) DO UPDATE SET closed_mask = excluded.closed_mask
+                ''', (date, closed_mask))
+            else:
+                cursor.execute('DELETE FROM slot_bitmaps WHERE date = ?', (date,))
+        self._bump_generation(cursor, 'slot_bitmaps')
+    
+    def _rebuild_slot_bitmaps(self, cursor):
+        cursor.execute('DELETE FROM slot_bitmaps')
+        cursor.execute('''
+            SELECT date FROM availability WHERE is_available = 0
+            UNION
+            SELECT service_date FROM slot_reservations
+        ''')
+        self._refresh_slot_bitmaps(cursor, [row[0] for row in cursor.fetchall()])
+    
+    def rebuild_slot_bitmaps(self):
+        """Recompute every closed-slot bitmap, e.g. after changing time slot capacities"""
+        self.run_cached_write(self._rebuild_slot_bitmaps)
+    
+    def get_slot_positions(self):
+        """Bit position of every time slot in the closed-slot bitmaps, as {time_slot_id: position}"""
+        def load():
+            return self._slot_positions(self.get_connection().cursor())
+        return self.cache.get('slot_positions', 'time_slots', load)
+    
+    def get_slot_bitmaps(self, start_date, end_date):
+        """Closed-slot bitmaps of the days from start_date to end_date, as {date: closed_mask}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT date, closed_mask FROM slot_bitmaps WHERE date BETWEEN ? AND ?',
+                       (start_date, end_date))
+        return dict(cursor.fetchall())
+    
+    def get_open_slots(self, start_date, end_date):
+        """Open time slots per day as [(date, [time_slot, ...])], answered from the bitmaps"""
+        # In the order of the day rather than get_time_slots()'s alphabetical order
+        time_slots = sorted(self.get_time_slots())
+        positions = self.get_slot_positions()
+        closed = self.get_slot_bitmaps(start_date, end_date)
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        days = []
+        for offset in range((end - start).days + 1):
+            date = (start + timedelta(days=offset)).isoformat()
+            closed_mask = closed.get(date, 0)
+            days.append((date, [time_slot for time_slot_id, time_slot in time_slots
+                                if not closed_mask >> positions[time_slot_id] & 1]))
+        return days
+    
+    def get_availability_range(self, start_date, end_date):
+        """Availability of every active time slot on every day from start_date to end_date.
+        
+        Returns (date, time_slot_id, time_slot, is_available) rows ordered by date and slot;
+        is_available is None for slots that were never set, which count as open.
+        """
+        conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT OR REPLACE INTO availability (date, time_slot_id, is_available)
-            VALUES (?, ?, ?)
-        ''', (date, time_slot_id, is_available))
-        conn.commit()
-        conn.close()
+            WITH RECURSIVE days(date) AS (
+                SELECT date(?)
+                UNION ALL
+                SELECT date(date, '+1 day') FROM days WHERE date < date(?)
+            )
+            SELECT days.date, ts.id, ts.time_slot, a.is_available
+            FROM days
+            CROSS JOIN time_slots ts
+            LEFT JOIN availability a ON a.date = days.date AND a.time_slot_id = ts.id
+            WHERE ts.is_active = 1
+            ORDER BY days.date, ts.id
+        ''', (start_date, end_date))
+        return cursor.fetchall()
+    
+    def set_availability(self, date, time_slot_id, is_available):
+        """Set availability for a specific date and time slot"""
+        self.set_availability_bulk([(date, time_slot_id, is_available)])
+    
+    def set_availability_bulk(self, entries):
+        """Upsert (date, time_slot_id, is_available) entries in one transaction; returns the count"""
+        entries = list(entries)
+        def write(cursor):
+            cursor.executemany('''
+                INSERT INTO availability (date, time_slot_id, is_available)
+                VALUES (?, ?, ?)
+                ON CONFLICT (date, time_slot_id) DO UPDATE SET is_available = excluded.is_available
+            ''', entries)
+            self._refresh_slot_bitmaps(cursor, [entry[0] for entry in entries])
+            return len(entries)
+        if not entries:
+            return 0
+        return self.run_cached_write(write, 'availability')
     
     def add_service(self, name, description, base_price):
         """Add a new service"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO services (name, description, base_price)
-            VALUES (?, ?, ?)
-        ''', (name, description, base_price))
-        service_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return service_id
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO services (name, description, base_price)
+                VALUES (?, ?, ?)
+            ''', (name, description, base_price))
+            return cursor.lastrowid
+        return self.run_cached_write(write, 'services')
     
     def update_service(self, service_id, name, description, base_price):
         """Update an existing service"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE services 
-            SET name = ?, description = ?, base_price = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (name, description, base_price, service_id))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute('''
+                UPDATE services 
+                SET name = ?, description = ?, base_price = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (name, description, base_price, service_id))
+        self.run_cached_write(write, 'services')
     
     def delete_service(self, service_id):
         """Delete a service (soft delete by setting is_active to 0)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE services 
-            SET is_active = 0, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (service_id,))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.execute('''
+                UPDATE services 
+                SET is_active = 0, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (service_id,))
+        self.run_cached_write(write, 'services')
     
     def add_booking(self, service_id, customer_name, customer_phone, customer_email, 
-                  customer_address, service_date, time_slot, description, total_price):
-        """Add a new booking"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO bookings 
-            (service_id, customer_name, customer_phone, customer_email, 
-             customer_address, service_date, time_slot, description, total_price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (service_id, customer_name, customer_phone, customer_email,
-               customer_address, service_date, time_slot, description, total_price))
-        booking_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return booking_id
+                  customer_address, service_date, time_slot, description, total_price=None):
+        """Book a time slot, claiming a free seat in the same transaction as the insert.
+        
+        Raises SlotUnavailable when the slot is closed or every seat is taken, and ValueError
+        for an unknown service or time slot. total_price defaults to the service's base price.
+        """
+        def write(cursor):
+            cursor.execute('SELECT base_price FROM services WHERE id = ? AND is_active = 1', (service_id,))
+            service = cursor.fetchone()
+            if service is None:
+                raise ValueError('Unknown service')
+            
+            cursor.execute('SELECT id, capacity FROM time_slots WHERE time_slot = ? AND is_active = 1', (time_slot,))
+            slot = cursor.fetchone()
+            if slot is None:
+                raise ValueError('Unknown time slot')
+            slot_id, capacity = slot
+            
+            cursor.execute('''
+                SELECT is_available FROM availability WHERE date = ? AND time_slot_id = ?
+            ''', (service_date, slot_id))
+            availability = cursor.fetchone()
+            if availability is not None and not availability[0]:
+                raise SlotUnavailable('That time slot is not available')
+            
+            cursor.execute('''
+                SELECT seat FROM slot_reservations WHERE service_date = ? AND time_slot = ?
+            ''', (service_date, time_slot))
+            taken = {row[0] for row in cursor.fetchall()}
+            seat = next((seat for seat in range(capacity) if seat not in taken), None)
+            if seat is None:
+                raise SlotUnavailable('That time slot is already booked')
+            
+            cursor.execute('''
+                INSERT INTO bookings 
+                (service_id, customer_name, customer_phone, customer_email, 
+                 customer_address, service_date, time_slot, description, total_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (service_id, customer_name, customer_phone, customer_email,
+                   customer_address, service_date, time_slot, description,
+                   service[0] if total_price is None else total_price))
+            booking_id = cursor.lastrowid
+            try:
+                cursor.execute('''
+                    INSERT INTO slot_reservations (service_date, time_slot, seat, booking_id)
+                    VALUES (?, ?, ?, ?)
+                ''', (service_date, time_slot, seat, booking_id))
+            except sqlite3.IntegrityError:
+                raise SlotUnavailable('That time slot is already booked')
+            if len(taken) + 1 >= capacity:
+                self._refresh_slot_bitmaps(cursor, [service_date])
+            return booking_id
+        return self.run_cached_write(write)
     
     def get_gallery_photos(self, category=None):
         """Get all gallery photos"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         if category:
-            cursor.execute('SELECT * FROM gallery_photos WHERE category = ? AND is_active = 1 ORDER BY display_order ASC', (category,))
+            cursor.execute('SELECT * FROM gallery_photos WHERE category = ? AND is_active = 1 ORDER BY display_order ASC, id ASC', (category,))
         else:
-            cursor.execute('SELECT * FROM gallery_photos WHERE is_active = 1 ORDER BY display_order ASC')
+            cursor.execute('SELECT * FROM gallery_photos WHERE is_active = 1 ORDER BY display_order ASC, id ASC')
         
         photos = cursor.fetchall()
-        conn.close()
         return photos
     
-    def add_gallery_photo(self, filename, title, description, category='general', display_order=0):
-        """Add a new gallery photo"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_gallery_page(self, category=None, after=None, limit=12):
+        """Get one page of public gallery photos in display order, and the key to pass as after for the next.
+        
+        Photos whose derivatives are still being rendered are left out. Rows are
+        (id, filename, title, description, category, display_order, variants). Later
+        pages depend on the client's cursor, so only first pages are cached in process.
+        """
+        def load():
+            conditions = ['is_active = 1', '(variants IS NOT NULL OR content_hash IS NULL)']
+            params = []
+            if category:
+                conditions.append('category = ?')
+                params.append(category)
+            if after is not None:
+                conditions.append('(display_order, id) > (?, ?)')
+                params.extend(after)
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, filename, title, description, category, display_order, variants
+                FROM gallery_photos
+                WHERE {' AND '.join(conditions)}
+                ORDER BY display_order, id
+                LIMIT ?
+            ''', params + [limit + 1])
+            rows = cursor.fetchall()
+            next_key = (rows[limit - 1][5], rows[limit - 1][0]) if len(rows) > limit else None
+            return rows[:limit], next_key
+        if after is not None:
+            return load()
+        return self.cache.get(f'gallery_page:{category}:{limit}', 'gallery_photos', load)
+    
+    def _insert_gallery_photo(self, cursor, filename, title, description, category, display_order, variants,
+                              content_hash=None):
         cursor.execute('''
-            INSERT INTO gallery_photos (filename, title, description, category, display_order)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (filename, title, description, category, display_order))
-        photo_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return photo_id
-    
-    def update_gallery_photo(self, photo_id, title, description, category, display_order):
-        """Update gallery photo information"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+            INSERT INTO gallery_photos (filename, title, description, category, display_order, variants, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (filename, title, description, category, display_order,
+              json.dumps(variants) if variants is not None else None, content_hash))
+        return cursor.lastrowid
+    
+    def _insert_image_job(self, cursor, photo_id, source_path):
         cursor.execute('''
-            UPDATE gallery_photos 
-            SET title = ?, description = ?, category = ?, display_order = ?
-            WHERE id = ?
-        ''', (title, description, category, display_order, photo_id))
-        conn.commit()
-        conn.close()
+            INSERT INTO image_jobs (photo_id, source_path) VALUES (?, ?)
+        ''', (photo_id, source_path))
+        return cursor.lastrowid
+    
+    def add_gallery_photo(self, filename, title, description, category='general', display_order=0, variants=None,
+                          source_path=None):
+        """Add a new gallery photo; pass source_path to queue its derivatives for the image workers"""
+        def write(cursor):
+            photo_id = self._insert_gallery_photo(cursor, filename, title, description, category,
+                                                  display_order, variants)
+            if source_path is not None:
+                self._insert_image_job(cursor, photo_id, source_path)
+            return photo_id
+        return self.run_cached_write(write, 'gallery_photos')
+    
+    def add_gallery_photos(self, photos):
+        """Add many content-addressed uploads in one transaction.
+        
+        photos is a list of (filename, title, description, category, content_hash, extension, size, blob_key)
+        tuples. Each photo takes a reference on its blob; only blobs that have no derivatives and no
+        job in flight get a processing job. Returns (photo_id, duplicate, processed) tuples in order.
+        """
+        def write(cursor):
+            # New photos go in front of the gallery in upload order, a gap apart, so they never tie
+            # with existing orders and a later move between them needs no respace
+            cursor.execute('SELECT MIN(display_order) FROM gallery_photos WHERE is_active = 1')
+            first = cursor.fetchone()[0]
+            first = first - len(photos) * GALLERY_ORDER_GAP if first is not None else GALLERY_ORDER_GAP
+            results = []
+            for index, (filename, title, description, category, content_hash, extension, size,
+                        blob_key) in enumerate(photos):
+                cursor.execute('SELECT variants FROM gallery_blobs WHERE sha256 = ?', (content_hash,))
+                blob = cursor.fetchone()
+                if blob is None:
+                    cursor.execute('''
+                        INSERT INTO gallery_blobs (sha256, extension, size, ref_count) VALUES (?, ?, ?, 1)
+                    ''', (content_hash, extension, size))
+                else:
+                    cursor.execute('''
+                        UPDATE gallery_blobs SET ref_count = ref_count + 1, unreferenced_at = NULL
+                        WHERE sha256 = ?
+                    ''', (content_hash,))
+                
+                variants = json.loads(blob[0]) if blob is not None and blob[0] else None
+                photo_id = self._insert_gallery_photo(cursor, filename, title, description, category,
+                                                      first + index * GALLERY_ORDER_GAP, variants, content_hash)
+                if variants is None:
+                    cursor.execute('''
+                        SELECT 1 FROM image_jobs j
+                        JOIN gallery_photos p ON p.id = j.photo_id
+                        WHERE p.content_hash = ? AND j.status IN ('queued', 'processing')
+                        LIMIT 1
+                    ''', (content_hash,))
+                    if cursor.fetchone() is None:
+                        self._insert_image_job(cursor, photo_id, blob_key)
+                results.append((photo_id, blob is not None, variants is not None))
+            return results
+        if not photos:
+            return []
+        return self.run_cached_write(write, 'gallery_photos')
+    
+    def update_gallery_photo(self, photo_id, title, description, category, display_order=None):
+        """Update gallery photo information, keeping its position unless display_order is given"""
+        def write(cursor):
+            cursor.execute('''
+                UPDATE gallery_photos 
+                SET title = ?, description = ?, category = ?, display_order = COALESCE(?, display_order)
+                WHERE id = ?
+            ''', (title, description, category, display_order, photo_id))
+        self.run_cached_write(write, 'gallery_photos')
+    
+    def update_gallery_photos(self, moves=(), edits=()):
+        """Apply photo moves and metadata edits in one transaction and return the new gallery generation.
+        
+        moves is a list of (photo_id, after_id) pairs applied in order; after_id None moves the
+        photo to the front. edits is a list of (photo_id, title, description, category) tuples.
+        A moved photo takes the display_order halfway between its new neighbours, and orders
+        are only respaced GALLERY_ORDER_GAP apart when two neighbours have no room left between them.
+        """
+        def write(cursor):
+            for photo_id, after_id in moves:
+                self._move_gallery_photo(cursor, photo_id, after_id)
+            if edits:
+                cursor.executemany('''
+                    UPDATE gallery_photos SET title = ?, description = ?, category = ?
+                    WHERE id = ? AND is_active = 1
+                ''', [(title, description, category, photo_id) for photo_id, title, description, category in edits])
+            self._bump_generation(cursor, 'gallery_photos')
+            cursor.execute("SELECT generation FROM cache_generations WHERE name = 'gallery_photos'")
+            return cursor.fetchone()[0]
+        try:
+            return self.run_write(write)
+        finally:
+            self.cache.invalidate()
+    
+    def _gallery_order(self, cursor, photo_id):
+        cursor.execute('SELECT display_order FROM gallery_photos WHERE id = ? AND is_active = 1', (photo_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f'Photo {photo_id} not found')
+        return row[0]
+    
+    def _move_gallery_photo(self, cursor, photo_id, after_id, respaced=False):
+        """Give photo_id a display_order between after_id (or the front) and the photo that follows it"""
+        self._gallery_order(cursor, photo_id)
+        if after_id is None:
+            before = None
+            cursor.execute('''
+                SELECT display_order FROM gallery_photos
+                WHERE is_active = 1 AND id != ?
+                ORDER BY display_order, id
+                LIMIT 1
+            ''', (photo_id,))
+        else:
+            before = self._gallery_order(cursor, after_id)
+            cursor.execute('''
+                SELECT display_order FROM gallery_photos
+                WHERE is_active = 1 AND (display_order, id) > (?, ?) AND id != ?
+                ORDER BY display_order, id
+                LIMIT 1
+            ''', (before, after_id, photo_id))
+        row = cursor.fetchone()
+        following = row[0] if row is not None else None
+        
+        if before is None:
+            order = following - GALLERY_ORDER_GAP if following is not None else GALLERY_ORDER_GAP
+        elif following is None:
+            order = before + GALLERY_ORDER_GAP
+        elif following - before > 1:
+            order = (before + following) // 2
+        elif not respaced:
+            self._respace_gallery_order(cursor)
+            return self._move_gallery_photo(cursor, photo_id, after_id, respaced=True)
+        else:
+            raise ValueError('No room to move photo')
+        cursor.execute('UPDATE gallery_photos SET display_order = ? WHERE id = ?', (order, photo_id))
+    
+    def _respace_gallery_order(self, cursor):
+        """Renumber every active photo GALLERY_ORDER_GAP apart, keeping the current order"""
+        cursor.execute('SELECT id FROM gallery_photos WHERE is_active = 1 ORDER BY display_order, id')
+        cursor.executemany('UPDATE gallery_photos SET display_order = ? WHERE id = ?',
+                           [((index + 1) * GALLERY_ORDER_GAP, photo_id)
+                            for index, (photo_id,) in enumerate(cursor.fetchall())])
     
     def delete_gallery_photo(self, photo_id):
-        """Delete a gallery photo"""
-        conn = sqlite3.connect(self.db_path)
+        """Delete a gallery photo, dropping its reference on the stored blob"""
+        def write(cursor):
+            cursor.execute('SELECT content_hash FROM gallery_photos WHERE id = ? AND is_active = 1', (photo_id,))
+            row = cursor.fetchone()
+            cursor.execute('UPDATE gallery_photos SET is_active = 0 WHERE id = ?', (photo_id,))
+            if row is not None and row[0]:
+                cursor.execute('''
+                    UPDATE gallery_blobs
+                    SET ref_count = ref_count - 1,
+                        unreferenced_at = CASE WHEN ref_count <= 1 THEN CURRENT_TIMESTAMP ELSE unreferenced_at END
+                    WHERE sha256 = ?
+                ''', (row[0],))
+        self.run_cached_write(write, 'gallery_photos')
+    
+    def release_unreferenced_blobs(self, grace_seconds=3600):
+        """Forget blobs that no photo has referenced for grace_seconds and return (sha256, extension) rows.
+        
+        The caller deletes the files once the rows are gone, so a concurrent upload of the
+        same bytes starts a fresh blob instead of referencing one being removed.
+        """
+        def write(cursor):
+            cursor.execute('''
+                SELECT sha256, extension FROM gallery_blobs
+                WHERE ref_count <= 0 AND unreferenced_at <= datetime('now', ?)
+            ''', (f'-{int(grace_seconds)} seconds',))
+            blobs = cursor.fetchall()
+            cursor.executemany('DELETE FROM gallery_blobs WHERE sha256 = ? AND ref_count <= 0',
+                               [(sha256,) for sha256, _ in blobs])
+            return blobs
+        return self.run_write(write)
+    
+    def get_gallery_storage_stats(self):
+        """Count stored blobs, their size and how many are waiting for garbage collection"""
+        conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('UPDATE gallery_photos SET is_active = 0 WHERE id = ?', (photo_id,))
-        conn.commit()
-        conn.close()
+        cursor.execute('''
+            SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(ref_count), 0),
+                   COALESCE(SUM(CASE WHEN ref_count <= 0 THEN 1 ELSE 0 END), 0)
+            FROM gallery_blobs
+        ''')
+        blobs, total_bytes, references, unreferenced = cursor.fetchone()
+        return {
+            'blobs': blobs,
+            'bytes': total_bytes,
+            'references': references,
+            'unreferenced': unreferenced
+        }
     
     def update_photo_order(self, photo_orders):
         """Update display order of multiple photos"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        for photo_id, order in photo_orders:
-            cursor.execute('UPDATE gallery_photos SET display_order = ? WHERE id = ?', (order, photo_id))
-        conn.commit()
-        conn.close()
+        def write(cursor):
+            cursor.executemany('UPDATE gallery_photos SET display_order = ? WHERE id = ?',
+                               [(order, photo_id) for photo_id, order in photo_orders])
+        self.run_cached_write(write, 'gallery_photos')
     
     def get_bookings(self, date=None):
         """Get bookings, optionally filtered by date"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         if date:
@@ -553,5 +1819,199 @@ class DatabaseManager:
             ''')
         
         bookings = cursor.fetchall()
-        conn.close()
         return bookings
+    
+    def get_bookings_page(self, start_date=None, end_date=None, statuses=None, service_id=None, after=None,
+                          limit=50, fields=None, descending=True):
+        """Get one page of bookings ordered by (service_date, time_slot, id).
+        
+        after is the (service_date, time_slot, id) of the last booking on the previous page.
+        Returns the bookings as dicts with the requested fields and the key to pass as after
+        for the next page (None on the last page).
+        """
+        fields = list(fields or BOOKING_FIELDS)
+        columns = [f'{BOOKING_FIELDS[field]} AS {field}' for field in fields]
+        # The keyset columns are always needed for the next cursor
+        columns += ['b.service_date AS _date', 'b.time_slot AS _slot', 'b.id AS _id']
+        joins = 'LEFT JOIN services s ON s.id = b.service_id' if 'service_name' in fields else ''
+        
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append('b.service_date >= ?')
+            params.append(start_date)
+        if end_date:
+            conditions.append('b.service_date <= ?')
+            params.append(end_date)
+        if statuses:
+            conditions.append(f"b.status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if service_id is not None:
+            conditions.append('b.service_id = ?')
+            params.append(service_id)
+        if after is not None:
+            conditions.append(f"(b.service_date, b.time_slot, b.id) {'<' if descending else '>'} (?, ?, ?)")
+            params.extend(after)
+        
+        direction = 'DESC' if descending else 'ASC'
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {', '.join(columns)}
+            FROM bookings b {joins}
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY b.service_date {direction}, b.time_slot {direction}, b.id {direction}
+            LIMIT ?
+        ''', params + [limit + 1])
+        rows = cursor.fetchall()
+        
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = tuple(rows[-1][-3:])
+        return [dict(zip(fields, row)) for row in rows], next_after
+    
+    def enqueue_email(self, sender, recipient, message):
+        """Queue a serialized email message for the background sender"""
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO outbound_emails (sender, recipient, message)
+                VALUES (?, ?, ?)
+            ''', (sender, recipient, message))
+            return cursor.lastrowid
+        return self.run_write(write)
+    
+    def claim_emails(self, limit=20, stale_after_seconds=600):
+        """Atomically claim due emails for sending, including ones abandoned by a crashed sender"""
+        def write(cursor):
+            cursor.execute('''
+                SELECT id, sender, recipient, message, attempts
+                FROM outbound_emails
+                WHERE (status = 'pending' AND next_attempt_at <= datetime('now'))
+                   OR (status = 'sending' AND claimed_at <= datetime('now', ?))
+                ORDER BY id
+                LIMIT ?
+            ''', (f'-{int(stale_after_seconds)} seconds', limit))
+            emails = cursor.fetchall()
+            cursor.executemany('''
+                UPDATE outbound_emails
+                SET status = 'sending', claimed_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(email[0],) for email in emails])
+            return emails
+        return self.run_write(write)
+    
+    def mark_emails_sent(self, email_ids):
+        """Record successful delivery of a batch of emails"""
+        def write(cursor):
+            cursor.executemany('''
+                UPDATE outbound_emails
+                SET status = 'sent', sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1, last_error = NULL
+                WHERE id = ?
+            ''', [(email_id,) for email_id in email_ids])
+        self.run_write(write)
+    
+    def mark_email_failed(self, email_id, error, retry_in_seconds=None):
+        """Record a failed delivery, scheduling a retry unless retry_in_seconds is None"""
+        def write(cursor):
+            if retry_in_seconds is None:
+                cursor.execute('''
+                    UPDATE outbound_emails
+                    SET status = 'failed', attempts = attempts + 1, last_error = ?
+                    WHERE id = ?
+                ''', (error, email_id))
+            else:
+                cursor.execute('''
+                    UPDATE outbound_emails
+                    SET status = 'pending', attempts = attempts + 1, last_error = ?,
+                        next_attempt_at = datetime('now', ?)
+                    WHERE id = ?
+                ''', (error, f'+{int(retry_in_seconds)} seconds', email_id))
+        self.run_write(write)
+    
+    def get_email_queue_stats(self):
+        """Count queued emails by delivery status"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM outbound_emails GROUP BY status')
+        stats = {'pending': 0, 'sending': 0, 'sent': 0, 'failed': 0}
+        stats.update(dict(cursor.fetchall()))
+        return stats
+    
+    def claim_image_jobs(self, limit=4, stale_after_seconds=600):
+        """Atomically claim queued image jobs, including ones abandoned by a crashed worker"""
+        def write(cursor):
+            cursor.execute('''
+                SELECT id, photo_id, source_path, attempts
+                FROM image_jobs
+                WHERE status = 'queued'
+                   OR (status = 'processing' AND started_at <= datetime('now', ?))
+                ORDER BY id
+                LIMIT ?
+            ''', (f'-{int(stale_after_seconds)} seconds', limit))
+            jobs = cursor.fetchall()
+            cursor.executemany('''
+                UPDATE image_jobs
+                SET status = 'processing', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+                WHERE id = ?
+            ''', [(job[0],) for job in jobs])
+            return jobs
+        return self.run_write(write)
+    
+    def complete_image_job(self, job_id, photo_id, variants):
+        """Store a photo's derivatives and mark its job done in one transaction"""
+        variants = json.dumps(variants)
+        def write(cursor):
+            cursor.execute('UPDATE gallery_photos SET variants = ? WHERE id = ?', (variants, photo_id))
+            # Duplicates of the same upload share the derivatives
+            cursor.execute('SELECT content_hash FROM gallery_photos WHERE id = ?', (photo_id,))
+            row = cursor.fetchone()
+            if row is not None and row[0]:
+                cursor.execute('UPDATE gallery_photos SET variants = ? WHERE content_hash = ?', (variants, row[0]))
+                cursor.execute('UPDATE gallery_blobs SET variants = ? WHERE sha256 = ?', (variants, row[0]))
+            cursor.execute('''
+                UPDATE image_jobs
+                SET status = 'done', error = NULL, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (job_id,))
+        self.run_cached_write(write, 'gallery_photos')
+    
+    def fail_image_job(self, job_id, error, retry=True):
+        """Record a failed job, putting it back in the queue when retry is True"""
+        def write(cursor):
+            cursor.execute('''
+                UPDATE image_jobs
+                SET status = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', ('queued' if retry else 'failed', error, job_id))
+        self.run_write(write)
+    
+    def get_image_job_status(self, photo_ids):
+        """Get the processing status of each photo, following duplicates to the job rendering their blob"""
+        if not photo_ids:
+            return []
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' * len(photo_ids))
+        cursor.execute(f'''
+            SELECT p.id,
+                   CASE WHEN p.variants IS NOT NULL THEN 'done' ELSE j.status END,
+                   j.error, p.variants
+            FROM gallery_photos p
+            JOIN image_jobs j ON j.id = (
+                SELECT MAX(j2.id) FROM image_jobs j2
+                JOIN gallery_photos p2 ON p2.id = j2.photo_id
+                WHERE p2.id = p.id OR p2.content_hash = p.content_hash
+            )
+            WHERE p.id IN ({placeholders})
+        ''', list(photo_ids))
+        return cursor.fetchall()
+    
+    def get_image_queue_stats(self):
+        """Count image jobs by status"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM image_jobs GROUP BY status')
+        stats = {'queued': 0, 'processing': 0, 'done': 0, 'failed': 0}
+        stats.update(dict(cursor.fetchall()))
+        return stats
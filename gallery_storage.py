@@ -0,0 +1,105 @@
+"""Content-addressed storage for gallery uploads.
+
+Originals are kept outside static/ under their SHA-256 (computed while the
+upload streams to disk), so identical uploads share one file and nothing
+with camera EXIF is ever served. Only the derivatives are public; their
+names start with the content hash, so their URLs never change meaning and
+can be cached forever.
+"""
+
+import os
+import glob
+import hashlib
+import tempfile
+import time
+
+
+class HashingFile:
+    """Temp file that computes the SHA-256 of everything written to it"""
+
+    def __init__(self, directory):
+        self._file = tempfile.NamedTemporaryFile('wb+', dir=directory, prefix='.upload-',
+                                                 suffix='.tmp', delete=False)
+        self.name = self._file.name
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class BlobStore:
+    """Maps content hashes to original files and their public derivative directory"""
+
+    def __init__(self, blob_dir, static_folder, public_subdir='images/gallery'):
+        self.blob_dir = blob_dir
+        self.static_folder = static_folder
+        self.public_subdir = public_subdir
+        self.temp_dir = os.path.join(blob_dir, 'tmp')
+
+    def temp_file(self):
+        """New hashing temp file on the same filesystem as the blobs, so storing is a rename"""
+        os.makedirs(self.temp_dir, exist_ok=True)
+        return HashingFile(self.temp_dir)
+
+    def blob_key(self, digest, extension):
+        """Path of a blob relative to the blob directory (what image jobs record)"""
+        return f'{digest[:2]}/{digest}{extension}'
+
+    def blob_path(self, key):
+        return os.path.join(self.blob_dir, *key.split('/'))
+
+    def store(self, temp_path, digest, extension):
+        """Move an upload into place, or drop it if the same bytes are already stored.
+
+        Returns the blob key and whether a new file was written. A blob already stored
+        under another extension keeps its key, so one digest never has two files.
+        """
+        key = self.blob_key(digest, extension)
+        path = self.blob_path(key)
+        existing = glob.glob(os.path.join(os.path.dirname(path), f'{digest}.*'))
+        if existing:
+            path = existing[0]
+            key = self.blob_key(digest, os.path.splitext(path)[1])
+        if os.path.exists(path):
+            os.remove(temp_path)
+            # Mark it as recently used so garbage collection leaves it alone
+            os.utime(path)
+            return key, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return key, True
+
+    def derivative_target(self, digest):
+        """Directory for a blob's derivatives and the matching path relative to static/"""
+        url_prefix = f'{self.public_subdir}/{digest[:2]}/'
+        return os.path.join(self.static_folder, *url_prefix.rstrip('/').split('/')), url_prefix
+
+    def remove(self, digest, extension, grace_seconds=0):
+        """Delete a blob and its derivatives unless the blob was touched within grace_seconds"""
+        path = self.blob_path(self.blob_key(digest, extension))
+        try:
+            if time.time() - os.path.getmtime(path) < grace_seconds:
+                return False
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        derivative_dir, _ = self.derivative_target(digest)
+        for derivative in glob.glob(os.path.join(derivative_dir, f'{digest}-*')):
+            os.remove(derivative)
+        return True
+
+
+def store_from_env(static_folder):
+    """Build a BlobStore rooted at GALLERY_BLOB_DIR (default: uploads/blobs next to the app)"""
+    blob_dir = os.environ.get('GALLERY_BLOB_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'blobs'))
+    return BlobStore(blob_dir, static_folder)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""Off-request image processing for gallery uploads.
+
+Uploads only insert an image_jobs row; an ImageJobRunner thread claims queued
+jobs and fans the Pillow work out to a process pool so it uses every core
+without holding a web worker. The same thread garbage-collects gallery blobs
+that no photo references any more.
+"""
+
+import os
+import posixpath
+import threading
+import time
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from image_pipeline import generate_derivatives
+from gallery_storage import store_from_env
+
+
+def process_image(source_path, output_dir, stem, url_prefix):
+    """Render an upload's derivatives (runs in a pool process)"""
+    return generate_derivatives(source_path, output_dir, stem, url_prefix=url_prefix)
+
+
+class ImageJobRunner:
+    """Claims queued image_jobs rows and runs them on a ProcessPoolExecutor"""
+
+    def __init__(self, db, store, max_workers=None, poll_interval=5.0, idle_timeout=60,
+                 max_attempts=3, gc_interval=600, gc_grace=3600):
+        self.db = db
+        self.store = store
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max_attempts
+        self.gc_interval = gc_interval
+        self.gc_grace = gc_grace
+        self._reset()
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._last_used = 0
+        self._last_gc = 0
+        self._stats = {'processed': 0, 'retried': 0, 'failed': 0, 'blobs_collected': 0}
+
+    def start(self):
+        """Start the dispatcher thread for this process if it isn't running"""
+        if os.getpid() != self._pid:
+            self._reset()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='image-jobs', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Tell the dispatcher there are new jobs, starting it if needed"""
+        self.start()
+        self._wake.set()
+
+    def stop(self):
+        """Finish the jobs in flight and shut the process pool down"""
+        if os.getpid() != self._pid:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=60)
+        self._shutdown_executor()
+
+    def get_stats(self):
+        """Counters describing processed jobs"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        stats['pool_active'] = self._executor is not None
+        stats['max_workers'] = self.max_workers
+        return stats
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn keeps the pool independent of the threads running in this web worker
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _shutdown_executor(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                print(f"Image job runner error: {e}")
+                claimed = 0
+            finally:
+                # Hand the pooled connection back between passes instead of holding it for good
+                self.db.release_connection()
+            if claimed:
+                continue
+            # Release the pool's memory when uploads have stopped for a while
+            if self._executor is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._shutdown_executor()
+            if time.monotonic() - self._last_gc > self.gc_interval:
+                try:
+                    self.collect_garbage()
+                except Exception as e:
+                    print(f"Gallery garbage collection error: {e}")
+                finally:
+                    self.db.release_connection()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        self._shutdown_executor()
+
+    def run_once(self):
+        """Claim a batch of jobs, process them in parallel and record the results"""
+        jobs = self.db.claim_image_jobs(self.max_workers * 2)
+        if not jobs:
+            return 0
+
+        futures = {}
+        for job_id, photo_id, source_path, attempts in jobs:
+            try:
+                future = self._get_executor().submit(process_image, *self._job_args(source_path))
+            except (RuntimeError, OSError) as e:
+                # The pool could not start; give the job back instead of leaving it claimed
+                self._shutdown_executor()
+                self._record_failure(job_id, attempts + 1, e)
+                continue
+            futures[future] = (job_id, photo_id, attempts + 1)
+
+        for future in as_completed(futures):
+            job_id, photo_id, attempts = futures[future]
+            try:
+                variants = future.result()
+            except BrokenProcessPool as e:
+                # A pool process died (e.g. out of memory); start a fresh pool for the retry
+                self._executor = None
+                self._record_failure(job_id, attempts, e)
+                continue
+            except Exception as e:
+                self._record_failure(job_id, attempts, e)
+                continue
+            self.db.complete_image_job(job_id, photo_id, variants)
+            with self._lock:
+                self._stats['processed'] += 1
+
+        self._last_used = time.monotonic()
+        return len(jobs)
+
+    def _job_args(self, blob_key):
+        digest = posixpath.basename(blob_key).split('.')[0]
+        output_dir, url_prefix = self.store.derivative_target(digest)
+        return self.store.blob_path(blob_key), output_dir, digest, url_prefix
+
+    def collect_garbage(self):
+        """Delete blobs (and their derivatives) that no photo has referenced for gc_grace seconds"""
+        self._last_gc = time.monotonic()
+        removed = 0
+        for digest, extension in self.db.release_unreferenced_blobs(self.gc_grace):
+            if self.store.remove(digest, extension, grace_seconds=self.gc_grace):
+                removed += 1
+        with self._lock:
+            self._stats['blobs_collected'] += removed
+        return removed
+
+    def _record_failure(self, job_id, attempts, error):
+        retry = attempts < self.max_attempts
+        self.db.fail_image_job(job_id, f'{type(error).__name__}: {error}', retry=retry)
+        with self._lock:
+            self._stats['retried' if retry else 'failed'] += 1
+
+
+def runner_from_env(db, store):
+    """Build an ImageJobRunner sized from the IMAGE_WORKERS environment variable"""
+    max_workers = os.environ.get('IMAGE_WORKERS')
+    return ImageJobRunner(db, store, max_workers=int(max_workers) if max_workers else None)
+
+
+if __name__ == '__main__':
+    # Run a dedicated image worker instead of one dispatcher per web worker
+    from database import DatabaseManager
+
+    db = DatabaseManager(os.environ.get('DATABASE_PATH', 'bolder_electric.db'))
+    runner = runner_from_env(db, store_from_env(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')))
+    print(f"Processing image jobs with {runner.max_workers} worker processes")
+    runner.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        runner.stop()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Responsive image derivatives for gallery uploads and bundled site images.
+
+Every source image is rendered at a few fixed widths in WebP and JPEG with
+orientation applied and EXIF removed, so templates can emit srcset lists
+instead of serving multi-megabyte originals.
+"""
+
+import os
+import json
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+# Named widths generated for every image (never upscaled)
+DERIVATIVE_WIDTHS = {
+    'thumb': 320,
+    'medium': 800,
+    'large': 1600
+}
+
+# format name -> (file extension, Pillow format, save options)
+DERIVATIVE_FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True})
+}
+
+# Pillow format -> extension an upload is stored under, whatever its file was called
+UPLOAD_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'WEBP': '.webp'
+}
+
+# Only photos get derivatives; the PNG logo keeps its transparency
+STATIC_SOURCE_EXTENSIONS = {'.jpg', '.jpeg'}
+STATIC_DERIVED_DIR = os.path.join('images', 'derived')
+STATIC_MANIFEST = 'manifest.json'
+
+
+def _flatten(img):
+    """Drop alpha onto white so the image can be written as JPEG"""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def _save_atomic(img, path, pil_format, options):
+    # Several workers may build the same file; never leave a half-written one behind
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    img.save(tmp_path, pil_format, **options)
+    os.replace(tmp_path, path)
+
+
+def upload_extension(path):
+    """Extension for an uploaded file from its actual image format, or None if it isn't one we accept"""
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(path) as img:
+            return UPLOAD_EXTENSIONS.get(img.format)
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+
+def generate_derivatives(source_path, output_dir, stem, url_prefix=''):
+    """Write resized, EXIF-free WebP/JPEG copies of an image and return their manifest.
+
+    File names in the manifest are url_prefix joined with the derivative name,
+    so callers can pass a path relative to the static folder.
+    """
+    if not PIL_AVAILABLE:
+        raise RuntimeError('Image processing not available. Please install Pillow.')
+
+    os.makedirs(output_dir, exist_ok=True)
+    with Image.open(source_path) as original:
+        # Bake the EXIF orientation into the pixels; EXIF itself is not written out
+        img = _flatten(ImageOps.exif_transpose(original))
+
+    variants = {'width': img.width, 'height': img.height}
+    for fmt in DERIVATIVE_FORMATS:
+        variants[fmt] = []
+
+    rendered_widths = set()
+    for size, width in sorted(DERIVATIVE_WIDTHS.items(), key=lambda item: item[1]):
+        width = min(width, img.width)
+        if width in rendered_widths:
+            continue
+        rendered_widths.add(width)
+        height = max(1, round(img.height * width / img.width))
+        resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+
+        for fmt, (extension, pil_format, options) in DERIVATIVE_FORMATS.items():
+            name = f'{stem}-{width}w.{extension}'
+            _save_atomic(resized, os.path.join(output_dir, name), pil_format, options)
+            variants[fmt].append({
+                'size': size,
+                'width': width,
+                'height': height,
+                'file': f'{url_prefix}{name}'
+            })
+
+    return variants
+
+
+def srcset(variants, fmt, build_url):
+    """Build a srcset attribute value, using build_url(file) to turn file names into URLs"""
+    if not variants:
+        return ''
+    return ', '.join(f"{build_url(v['file'])} {v['width']}w" for v in variants.get(fmt, []))
+
+
+def build_static_derivatives(static_dir='static', source_subdir='images'):
+    """Generate derivatives for bundled site images, skipping ones that are up to date"""
+    source_dir = os.path.join(static_dir, source_subdir)
+    output_dir = os.path.join(static_dir, STATIC_DERIVED_DIR)
+    manifest_path = os.path.join(output_dir, STATIC_MANIFEST)
+    manifest = load_static_manifest(static_dir)
+
+    changed = False
+    for name in sorted(os.listdir(source_dir)):
+        source_path = os.path.join(source_dir, name)
+        stem, extension = os.path.splitext(name)
+        if not os.path.isfile(source_path) or extension.lower() not in STATIC_SOURCE_EXTENSIONS:
+            continue
+
+        key = f'{source_subdir}/{name}'
+        stat = os.stat(source_path)
+        signature = [stat.st_size, int(stat.st_mtime)]
+        entry = manifest.get(key)
+        if entry and entry.get('source') == signature:
+            continue
+
+        try:
+            variants = generate_derivatives(source_path, output_dir, stem,
+                                            url_prefix=STATIC_DERIVED_DIR.replace(os.sep, '/') + '/')
+        except (OSError, ValueError) as e:
+            print(f"Could not build derivatives for {key}: {e}")
+            continue
+        variants['source'] = signature
+        manifest[key] = variants
+        changed = True
+
+    if changed:
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def load_static_manifest(static_dir='static'):
+    """Read the derivative manifest for bundled site images"""
+    try:
+        with open(os.path.join(static_dir, STATIC_DERIVED_DIR, STATIC_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+if __name__ == '__main__':
+    # Pre-build derivatives at deploy time: python image_pipeline.py
+    built = build_static_derivatives()
+    print(f"{len(built)} images have responsive derivatives")
@@ -0,0 +1,189 @@
+"""Request timing, SQLite query counting and slow-path logging.
+
+When enabled, every request records how long it spent in SQLite queries on
+its own thread, waiting for a pooled connection, waiting on the writer
+thread and rendering templates, plus any named spans the views add. The
+breakdown is sent back in a Server-Timing header (browser dev tools show it
+under Timing) and requests or queries over their thresholds are logged:
+
+    INSTRUMENTATION=1 SLOW_REQUEST_MS=500 SLOW_QUERY_MS=50 gunicorn app:app
+
+When disabled nothing is hooked in: DatabaseManager gets no observer and
+span() hands back a shared no-op context manager.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+
+_NO_SPAN = nullcontext()
+
+
+class Instrumentation:
+    """Per-request timings reported as Server-Timing, with slow request and slow query logs"""
+
+    def __init__(self, enabled=True, slow_request_ms=500, slow_query_ms=50, server_timing=True):
+        self.enabled = enabled
+        self.slow_request = slow_request_ms / 1000.0
+        self.slow_query = slow_query_ms / 1000.0
+        self.server_timing = server_timing
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'slow_requests': 0, 'queries': 0, 'slow_queries': 0, 'lock_retries': 0}
+
+    def init_app(self, app):
+        """Register the request hooks; does nothing when disabled"""
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+
+    def observer(self):
+        """Timing hooks for DatabaseManager, or None when disabled"""
+        return self if self.enabled else None
+
+    def _timings(self):
+        if not has_request_context():
+            return None
+        return g.get('_timings')
+
+    def add(self, name, seconds, count=1):
+        """Add time (and a count) to one Server-Timing entry of the current request"""
+        timings = self._timings()
+        if timings is not None:
+            entry = timings.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += count
+
+    def span(self, name):
+        """Context manager timing a block of the current request under name"""
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    # DatabaseManager observer hooks
+
+    def query(self, statement, seconds, executed):
+        """One execute (executed=True) or fetch of statement, on whichever thread ran it"""
+        self.add('db', seconds, 1 if executed else 0)
+        if executed:
+            with self._lock:
+                self._stats['queries'] += 1
+        if seconds >= self.slow_query:
+            with self._lock:
+                self._stats['slow_queries'] += 1
+            where = f' during {request.method} {request.path}' if has_request_context() else ''
+            step = 'query' if executed else 'fetch'
+            print(f"Slow {step} ({seconds * 1000:.1f} ms){where}: {' '.join((statement or '').split())[:300]}")
+
+    def connection(self, seconds):
+        self.add('db-pool', seconds)
+
+    def write(self, seconds):
+        self.add('db-write', seconds)
+
+    def lock_retry(self):
+        with self._lock:
+            self._stats['lock_retries'] += 1
+
+    # Flask hooks
+
+    def _start_request(self):
+        g._timings = {}
+        g._request_started = time.perf_counter()
+
+    def _start_render(self, sender, template, context, **extra):
+        g._render_started = time.perf_counter()
+
+    def _finish_render(self, sender, template, context, **extra):
+        started = g.pop('_render_started', None)
+        if started is not None:
+            self.add('render', time.perf_counter() - started)
+
+    def _finish_request(self, response):
+        timings = g.pop('_timings', None)
+        started = g.pop('_request_started', None)
+        if timings is None or started is None:
+            return response
+        total = time.perf_counter() - started
+        slow = total >= self.slow_request
+        with self._lock:
+            self._stats['requests'] += 1
+            if slow:
+                self._stats['slow_requests'] += 1
+
+        if self.server_timing:
+            entries = [self._format(name, seconds, count) for name, (seconds, count) in timings.items()]
+            entries.append(f'app;dur={total * 1000:.2f}')
+            response.headers['Server-Timing'] = ', '.join(entries)
+        if slow:
+            breakdown = ', '.join(f'{name} {seconds * 1000:.1f} ms' + (f' ({count})' if name == 'db' else '')
+                                  for name, (seconds, count) in timings.items())
+            print(f'Slow request ({total * 1000:.1f} ms): {request.method} {request.full_path.rstrip("?")} '
+                  f'-> {response.status_code}' + (f' [{breakdown}]' if breakdown else ''))
+        return response
+
+    def _format(self, name, seconds, count):
+        entry = f'{name};dur={seconds * 1000:.2f}'
+        if name == 'db':
+            entry += f';desc="{count} queries"'
+        return entry
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['enabled'] = self.enabled
+        return stats
+
+
+class Observers:
+    """Fans DatabaseManager's timing hooks out to several observers"""
+
+    def __init__(self, observers):
+        self.observers = observers
+
+    def query(self, statement, seconds, executed):
+        for observer in self.observers:
+            observer.query(statement, seconds, executed)
+
+    def connection(self, seconds):
+        for observer in self.observers:
+            observer.connection(seconds)
+
+    def write(self, seconds):
+        for observer in self.observers:
+            observer.write(seconds)
+
+    def lock_retry(self):
+        for observer in self.observers:
+            observer.lock_retry()
+
+
+def combine_observers(*observers):
+    """One observer for DatabaseManager out of any that are enabled, or None"""
+    observers = [observer for observer in observers if observer is not None]
+    if not observers:
+        return None
+    return observers[0] if len(observers) == 1 else Observers(observers)
+
+
+def instrumentation_from_env():
+    """Build an Instrumentation configured from INSTRUMENTATION and SLOW_* environment variables"""
+    return Instrumentation(
+        enabled=os.environ.get('INSTRUMENTATION', '0') == '1',
+        slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', 500)),
+        slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 50)),
+        server_timing=os.environ.get('SERVER_TIMING', '1') == '1'
+    )
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Retention for the access_logs table.
+
+Rows older than the retention period are appended to one gzipped JSON Lines
+file per day under the archive directory, folded into daily counts per
+action, outcome and IP address in access_log_daily, and then deleted. Run
+it from cron or a systemd timer:
+
+    python log_retention.py            # LOG_RETENTION_DAYS, LOG_ARCHIVE_DIR
+"""
+
+import os
+import gzip
+import json
+import time
+import fcntl
+from datetime import datetime, timedelta, timezone
+
+
+class LogRetention:
+    """Archives, rolls up and prunes access_logs rows older than retention_days"""
+
+    def __init__(self, db, archive_dir, retention_days=90, batch_size=5000):
+        self.db = db
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+
+    def cutoff(self, now=None):
+        """Timestamp (UTC, CURRENT_TIMESTAMP format) before which rows are expired"""
+        now = now or datetime.now(timezone.utc)
+        return (now - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    def archive_path(self, day):
+        return os.path.join(self.archive_dir, day[:4], f'access-{day}.jsonl.gz')
+
+    def run_once(self, now=None):
+        """Archive and prune every expired row; returns {'archived': n, 'files': n}"""
+        cutoff = self.cutoff(now)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archived = 0
+        files = set()
+        # One run at a time, or two would archive the same rows twice
+        with open(os.path.join(self.archive_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            while True:
+                rows = self.db.get_expired_access_logs(cutoff, self.batch_size)
+                if not rows:
+                    break
+                files.update(self._archive(rows))
+                # Files are synced first, so a crash can only archive a row twice, never lose it
+                removed = self.db.rollup_access_logs(cutoff, (rows[-1][6], rows[-1][0]))
+                if not removed:
+                    break
+                archived += removed
+        return {'archived': archived, 'files': len(files)}
+
+    def _archive(self, rows):
+        by_day = {}
+        for log_id, username, ip_address, user_agent, action, success, timestamp in rows:
+            by_day.setdefault(timestamp[:10], []).append({
+                'id': log_id,
+                'username': username,
+                'ip_address': ip_address,
+                'user_agent': user_agent,
+                'action': action,
+                'success': bool(success),
+                'timestamp': timestamp
+            })
+
+        paths = []
+        for day, entries in by_day.items():
+            path = self.archive_path(day)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = ''.join(json.dumps(entry) + '\n' for entry in entries).encode('utf-8')
+            # Each run appends a new gzip member; gzip readers treat them as one stream
+            with open(path, 'ab') as f:
+                f.write(gzip.compress(data, mtime=0))
+                f.flush()
+                os.fsync(f.fileno())
+            paths.append(path)
+        return paths
+
+
+def retention_from_env(db):
+    """Build a LogRetention configured from LOG_* environment variables"""
+    return LogRetention(
+        db,
+        os.environ.get('LOG_ARCHIVE_DIR',
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive', 'access_logs')),
+        retention_days=int(os.environ.get('LOG_RETENTION_DAYS', 90))
+    )
+
+
+if __name__ == '__main__':
+    from database import DatabaseManager
+
+    db = DatabaseManager(os.environ.get('DATABASE_PATH', 'bolder_electric.db'))
+    retention = retention_from_env(db)
+    started = time.monotonic()
+    result = retention.run_once()
+    db.close()
+    print(f"Archived {result['archived']} access log rows older than {retention.retention_days} days "
+          f"into {result['files']} files under {retention.archive_dir} in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Background delivery of queued emails over a persistent SMTP connection.
+
+Web workers only insert into the outbound_emails table; a MailSender thread
+(or a standalone `python mail_queue.py` process) drains it in batches.
+"""
+
+import os
+import smtplib
+import threading
+import time
+import atexit
+
+
+class MailSender:
+    """Drains outbound_emails in batches, reusing one SMTP connection between batches"""
+
+    def __init__(self, db, host='localhost', port=25, batch_size=20, poll_interval=5.0,
+                 max_attempts=6, base_backoff=30, max_backoff=3600, idle_timeout=60, timeout=30):
+        self.db = db
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._reset()
+        atexit.register(self.stop)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._smtp = None
+        self._last_used = 0
+        self._stats = {
+            'sent': 0,
+            'retried': 0,
+            'failed': 0,
+            'connections_opened': 0,
+            'connections_reused': 0
+        }
+
+    def start(self):
+        """Start the sender thread for this process if it isn't running"""
+        if os.getpid() != self._pid:
+            self._reset()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='mail-sender', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Tell the sender there is new mail, starting it if needed"""
+        self.start()
+        self._wake.set()
+
+    def stop(self):
+        """Finish the current batch and stop the sender thread"""
+        if os.getpid() != self._pid:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout=self.timeout)
+        self._close_smtp()
+
+    def get_stats(self):
+        """Counters describing delivery and connection reuse"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception as e:
+                print(f"Mail sender error: {e}")
+                sent = 0
+            finally:
+                # Hand the pooled connection back between passes instead of holding it for good
+                self.db.release_connection()
+            if sent:
+                continue
+            if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._close_smtp()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        self._close_smtp()
+
+    def drain_once(self):
+        """Claim and deliver one batch, returning how many emails were claimed"""
+        emails = self.db.claim_emails(self.batch_size)
+        if not emails:
+            return 0
+
+        sent_ids = []
+        for email_id, sender, recipient, message, attempts in emails:
+            try:
+                self._deliver(sender, recipient, message)
+                sent_ids.append(email_id)
+            except Exception as e:
+                self._record_failure(email_id, attempts, e)
+
+        if sent_ids:
+            self.db.mark_emails_sent(sent_ids)
+            with self._lock:
+                self._stats['sent'] += len(sent_ids)
+        self._last_used = time.monotonic()
+        return len(emails)
+
+    def _deliver(self, sender, recipient, message):
+        smtp = self._get_smtp()
+        try:
+            smtp.sendmail(sender, [recipient], message)
+        except smtplib.SMTPServerDisconnected:
+            # The MTA dropped an idle connection; reconnect once and retry
+            self._close_smtp()
+            self._get_smtp().sendmail(sender, [recipient], message)
+
+    def _record_failure(self, email_id, attempts, error):
+        attempts += 1
+        if self._is_permanent(error) or attempts >= self.max_attempts:
+            self.db.mark_email_failed(email_id, str(error))
+            with self._lock:
+                self._stats['failed'] += 1
+            return
+        backoff = min(self.base_backoff * (2 ** (attempts - 1)), self.max_backoff)
+        self.db.mark_email_failed(email_id, str(error), retry_in_seconds=backoff)
+        with self._lock:
+            self._stats['retried'] += 1
+        if not isinstance(error, smtplib.SMTPResponseException):
+            # Connection-level errors leave the session in an unknown state
+            self._close_smtp()
+
+    def _is_permanent(self, error):
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in error.recipients.values())
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code >= 500
+        return False
+
+    def _get_smtp(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    with self._lock:
+                        self._stats['connections_reused'] += 1
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+
+        self._smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return self._smtp
+
+    def _close_smtp(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+
+def sender_from_env(db):
+    """Build a MailSender configured from SMTP_* environment variables"""
+    return MailSender(
+        db,
+        host=os.environ.get('SMTP_HOST', 'localhost'),
+        port=int(os.environ.get('SMTP_PORT', 25)),
+        batch_size=int(os.environ.get('SMTP_BATCH_SIZE', 20))
+    )
+
+
+if __name__ == '__main__':
+    # Run a dedicated sender process instead of one thread per web worker
+    from database import DatabaseManager
+
+    db = DatabaseManager(os.environ.get('DATABASE_PATH', 'bolder_electric.db'))
+    sender = sender_from_env(db)
+    print(f"Delivering queued email via {sender.host}:{sender.port}")
+    sender.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        sender.stop()
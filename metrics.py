@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""Prometheus metrics shared by every gunicorn worker.
+
+Each worker process writes its counters to its own memory-mapped file in
+METRICS_DIR (in /dev/shm when it exists), so recording a request or query
+never waits on another process. A scrape reads every file in the directory
+and adds them up, which keeps counts right across workers and across
+restarted workers. Gauges such as the mail queue depth are read from SQLite
+at scrape time. Scrape /metrics as an admin or with METRICS_TOKEN as a
+bearer token, or run this module to serve the same text on its own port:
+
+    METRICS=1 gunicorn app:app           # record
+    python metrics.py                    # serve on 127.0.0.1:METRICS_PORT (9100)
+
+Clear METRICS_DIR before starting gunicorn, or counts carry over from the
+previous run's worker files.
+"""
+
+import os
+import glob
+import mmap
+import time
+import struct
+import hashlib
+import tempfile
+import threading
+
+from flask import g, request
+
+# Header: format version, slots
+HEADER = struct.Struct('<QQ')
+FORMAT_VERSION = 1
+# Slot: key hash (0 = empty), series key (UTF-8, NUL padded), value
+SLOT = struct.Struct('<Q112sd')
+# Separates metric name, labels and histogram bound in a series key
+SEPARATOR = '\x1f'
+DROPPED_KEY = f'metrics_dropped_total{SEPARATOR}{SEPARATOR}'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# name -> (type, help); everything is prefixed with bolder_ when exposed
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'sqlite_queries_total': ('counter', 'SQLite statements executed'),
+    'sqlite_query_duration_seconds': ('histogram', 'Time to execute a SQLite statement, without fetching'),
+    'sqlite_query_seconds_total': ('counter', 'Time spent executing and fetching SQLite statements'),
+    'sqlite_pool_wait_seconds_total': ('counter', 'Time spent checking out pooled connections'),
+    'sqlite_writes_total': ('counter', 'Writes run on the writer thread and waited for'),
+    'sqlite_write_wait_seconds_total': ('counter', 'Time requests waited for the writer thread'),
+    'sqlite_lock_retries_total': ('counter', 'BEGIN IMMEDIATE retries after the database was locked'),
+    'upload_bytes_total': ('counter', 'Bytes of accepted gallery uploads'),
+    'email_queue': ('gauge', 'Outbound emails by delivery status'),
+    'image_jobs': ('gauge', 'Image processing jobs by status'),
+    'metrics_dropped_total': ('counter', 'Samples dropped because a worker metrics file was full')
+}
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class MetricsFile:
+    """One process's series in a fixed-size open-addressing table in an mmap file"""
+
+    def __init__(self, path, slots=4096):
+        self.path = path
+        self.slots = slots
+        self.size = HEADER.size + SLOT.size * slots
+        self._lock = threading.Lock()
+        self._offsets = {}
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self._map, 0, FORMAT_VERSION, slots)
+
+    def _offset(self, key):
+        """Slot offset for key, claiming an empty slot if it's new; None when the table is full"""
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        encoded = key.encode('utf-8')[:SLOT.size - 16]
+        key_hash = int.from_bytes(hashlib.blake2b(encoded, digest_size=8).digest(), 'little') or 1
+        start = key_hash % self.slots
+        for probe in range(self.slots):
+            offset = HEADER.size + SLOT.size * ((start + probe) % self.slots)
+            slot_hash, slot_key, _ = SLOT.unpack_from(self._map, offset)
+            if slot_hash == 0:
+                # The hash goes in last, so readers never see a claimed slot without its key
+                SLOT.pack_into(self._map, offset, 0, encoded, 0.0)
+                struct.pack_into('<Q', self._map, offset, key_hash)
+            elif slot_hash != key_hash or slot_key.rstrip(b'\0') != encoded:
+                continue
+            self._offsets[key] = offset
+            return offset
+        return None
+
+    def add(self, key, amount):
+        with self._lock:
+            offset = self._offset(key)
+            if offset is None:
+                return False
+            value_offset = offset + SLOT.size - 8
+            value, = struct.unpack_from('<d', self._map, value_offset)
+            struct.pack_into('<d', self._map, value_offset, value + amount)
+            return True
+
+    def close(self):
+        self._map.close()
+
+
+def read_file(path):
+    """Yield (key, value) for every series in one metrics file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return
+    version, slots = HEADER.unpack_from(data, 0)
+    if version != FORMAT_VERSION:
+        return
+    for index in range(min(slots, (len(data) - HEADER.size) // SLOT.size)):
+        key_hash, key, value = SLOT.unpack_from(data, HEADER.size + SLOT.size * index)
+        if key_hash:
+            yield key.rstrip(b'\0').decode('utf-8', 'replace'), value
+
+
+class Metrics:
+    """Counters and histograms recorded per process and summed over all of them at scrape time"""
+
+    def __init__(self, directory, enabled=True, slots=4096):
+        self.directory = directory
+        self.enabled = enabled
+        self.slots = slots
+        self._pid = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _current_file(self):
+        # Opened lazily, and again after a fork, so every worker writes its own file
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._file = MetricsFile(os.path.join(self.directory, f'worker-{os.getpid()}.metrics'),
+                                             self.slots)
+                    # Claimed up front so drops can still be counted once the table is full
+                    self._file.add(DROPPED_KEY, 0)
+                    self._pid = os.getpid()
+        return self._file
+
+    def _add(self, key, amount):
+        metrics_file = self._current_file()
+        if not metrics_file.add(key, amount):
+            metrics_file.add(DROPPED_KEY, 1)
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        if self.enabled:
+            self._add(f'{name}{SEPARATOR}{_labels(labels)}{SEPARATOR}', amount)
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """Record one histogram sample; buckets are cumulated when the metrics are read"""
+        if not self.enabled:
+            return
+        label_text = _labels(labels)
+        bound = next((str(b) for b in buckets if value <= b), '+Inf')
+        self._add(f'{name}{SEPARATOR}{label_text}{SEPARATOR}{bound}', 1)
+        self._add(f'{name}_sum{SEPARATOR}{label_text}{SEPARATOR}', value)
+        self._add(f'{name}_count{SEPARATOR}{label_text}{SEPARATOR}', 1)
+
+    def init_app(self, app):
+        """Time every request per endpoint; does nothing when disabled"""
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def observer(self):
+        """Timing hooks for DatabaseManager, or None when disabled"""
+        return self if self.enabled else None
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            self.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+            self.observe('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+    # DatabaseManager observer hooks
+
+    def query(self, statement, seconds, executed):
+        if executed:
+            self.inc('sqlite_queries_total')
+            self.observe('sqlite_query_duration_seconds', seconds, buckets=QUERY_BUCKETS)
+        self.inc('sqlite_query_seconds_total', seconds)
+
+    def connection(self, seconds):
+        self.inc('sqlite_pool_wait_seconds_total', seconds)
+
+    def write(self, seconds):
+        self.inc('sqlite_writes_total')
+        self.inc('sqlite_write_wait_seconds_total', seconds)
+
+    def lock_retry(self):
+        self.inc('sqlite_lock_retries_total')
+
+    # Reading
+
+    def collect(self):
+        """Sum every worker file into {key: value}"""
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, '*.metrics')):
+            try:
+                for key, value in read_file(path):
+                    totals[key] = totals.get(key, 0.0) + value
+            except OSError:
+                continue
+        return totals
+
+    def render(self, db=None):
+        """Prometheus text exposition of every worker's series, plus gauges read from db"""
+        series = {}
+        for key, value in self.collect().items():
+            parts = key.split(SEPARATOR)
+            if len(parts) != 3:
+                continue
+            name, labels, bound = parts
+            series.setdefault(name, []).append((labels, bound, value))
+        if db is not None:
+            series['email_queue'] = [(_labels({'status': status}), '', count)
+                                     for status, count in db.get_email_queue_stats().items()]
+            series['image_jobs'] = [(_labels({'status': status}), '', count)
+                                    for status, count in db.get_image_queue_stats().items()]
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = series.get(name, [])
+            if kind == 'histogram':
+                samples = self._histogram(name, samples, series)
+            else:
+                samples = [(f'bolder_{name}', labels, value) for labels, _, value in sorted(samples)]
+            if not samples:
+                continue
+            lines.append(f'# HELP bolder_{name} {help_text}')
+            lines.append(f'# TYPE bolder_{name} {kind}')
+            for sample_name, labels, value in samples:
+                value = _format_value(value)
+                lines.append(f'{sample_name}{{{labels}}} {value}' if labels else f'{sample_name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, name, samples, series):
+        buckets = QUERY_BUCKETS if name == 'sqlite_query_duration_seconds' else DURATION_BUCKETS
+        counts = {}
+        for labels, bound, value in samples:
+            counts.setdefault(labels, {})[bound] = value
+        sums = {labels: value for labels, _, value in series.get(f'{name}_sum', [])}
+        totals = {labels: value for labels, _, value in series.get(f'{name}_count', [])}
+
+        result = []
+        for labels in sorted(counts):
+            running = 0.0
+            for bound in [str(b) for b in buckets] + ['+Inf']:
+                running += counts[labels].get(bound, 0.0)
+                bucket_labels = f'{labels},le="{bound}"' if labels else f'le="{bound}"'
+                result.append((f'bolder_{name}_bucket', bucket_labels, running))
+            result.append((f'bolder_{name}_sum', labels, sums.get(labels, 0.0)))
+            result.append((f'bolder_{name}_count', labels, totals.get(labels, running)))
+        return result
+
+
+def metrics_from_env():
+    """Build a Metrics configured from METRICS* environment variables"""
+    shared_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return Metrics(
+        os.environ.get('METRICS_DIR', os.path.join(shared_dir, 'bolder_electric_metrics')),
+        enabled=os.environ.get('METRICS', '0') == '1'
+    )
+
+
+if __name__ == '__main__':
+    from wsgiref.simple_server import make_server
+    from database import DatabaseManager
+
+    metrics = metrics_from_env()
+    db = DatabaseManager(os.environ.get('DATABASE_PATH', 'bolder_electric.db'))
+
+    def exporter(environ, start_response):
+        if environ.get('PATH_INFO') != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not found\n']
+        body = metrics.render(db).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')])
+        return [body]
+
+    host = os.environ.get('METRICS_HOST', '127.0.0.1')
+    port = int(os.environ.get('METRICS_PORT', 9100))
+    print(f'Serving metrics from {metrics.directory} on http://{host}:{port}/metrics')
+    make_server(host, port, exporter).serve_forever()
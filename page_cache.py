@@ -0,0 +1,151 @@
+"""Rendered-page cache for public routes.
+
+A page is rendered once per combination of route, site version and the
+generations of the tables it reads, then stored in SQLite so every gunicorn
+worker serves the same bytes. Admin writes bump the table generations (see
+DatabaseManager.run_cached_write), which changes the key, so stale pages are
+never looked up again. Each representation carries a strong ETag, and
+conditional GETs are answered with 304 without rendering or reading the body.
+"""
+
+import os
+import hashlib
+import threading
+from functools import wraps
+
+from flask import Response, request
+
+from compression import compress, negotiate
+
+
+def site_version(*directories, extra=''):
+    """Hash of every file under the given directories, so a deploy starts a fresh cache"""
+    digest = hashlib.sha256(extra.encode())
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, directory).encode())
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+class PageCache:
+    """Whole-page cache in SQLite with a per-process index of known ETags"""
+
+    def __init__(self, db, version, max_entries=256):
+        self.db = db
+        self.version = version
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # cache_key -> (etag, content_type); bodies stay in SQLite
+        self._index = {}
+        self._stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+    def key(self, path, tables):
+        generations = self.db.get_generations()
+        state = ','.join(f'{table}={generations.get(table, 0)}' for table in tables)
+        return f'{self.version}:{path}:{state}'
+
+    def _lookup(self, cache_key):
+        entry = self._index.get(cache_key)
+        if entry is None:
+            row = self.db.get_cached_page(cache_key)
+            if row is not None:
+                entry = self._remember(cache_key, row[0], row[1])
+        return entry
+
+    def _remember(self, cache_key, etag, content_type):
+        with self._lock:
+            if len(self._index) >= self.max_entries:
+                self._index.clear()
+            self._index[cache_key] = (etag, content_type)
+        return etag, content_type
+
+    def _store(self, cache_key, path, body, content_type):
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self.db.store_cached_page(cache_key, path, etag, content_type, body)
+        return self._remember(cache_key, etag, content_type)
+
+    def _forget(self, cache_key):
+        with self._lock:
+            self._index.pop(cache_key, None)
+
+    def _body(self, cache_key, path, etag, content_type, encoding, identity=None):
+        """Body for one encoding, compressing the identity body once if needed.
+
+        Returns None when the identity row is gone, e.g. replaced by another worker's render.
+        """
+        if identity is None:
+            row = self.db.get_cached_page(cache_key, encoding or '')
+            if row is not None:
+                return row[2]
+            row = self.db.get_cached_page(cache_key) if encoding else None
+            if row is None:
+                return None
+            identity = row[2]
+        if not encoding:
+            return identity
+        body = compress(identity, encoding)
+        self.db.store_cached_page(cache_key, path, f'{etag}-{encoding}', content_type, body,
+                                  encoding=encoding)
+        return body
+
+    def cached(self, *tables):
+        """Decorator for GET views whose output depends only on the given tables"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or request.args:
+                    return view(*args, **kwargs)
+
+                cache_key = self.key(request.path, tables)
+                encoding = negotiate(request.accept_encodings)
+                entry = self._lookup(cache_key)
+                body = None
+                stat = 'hits'
+                if entry is not None and not request.if_none_match.contains(self._etag(entry[0], encoding)):
+                    body = self._body(cache_key, request.path, entry[0], entry[1], encoding)
+                    if body is None:
+                        # Another worker stored a newer render of this route over ours; render again
+                        self._forget(cache_key)
+                        entry = None
+                if entry is None:
+                    result = view(*args, **kwargs)
+                    if not isinstance(result, str):
+                        return result
+                    identity = result.encode('utf-8')
+                    entry = self._store(cache_key, request.path, identity, 'text/html; charset=utf-8')
+                    body = self._body(cache_key, request.path, entry[0], entry[1], encoding, identity)
+                    stat = 'misses'
+                etag, content_type = entry
+
+                representation_etag = self._etag(etag, encoding)
+                if request.if_none_match.contains(representation_etag):
+                    response = Response(status=304)
+                    stat = 'not_modified'
+                else:
+                    response = Response(body, content_type=content_type)
+                    if encoding:
+                        response.headers['Content-Encoding'] = encoding
+                with self._lock:
+                    self._stats[stat] += 1
+
+                response.set_etag(representation_etag)
+                response.vary.add('Accept-Encoding')
+                # Browsers revalidate every time, which costs a 304 once the page is cached
+                response.cache_control.no_cache = True
+                return response
+            return wrapper
+        return decorator
+
+    def _etag(self, etag, encoding):
+        return f'{etag}-{encoding}' if encoding else etag
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['indexed'] = len(self._index)
+        return stats
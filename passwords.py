@@ -0,0 +1,129 @@
+"""Password hashing for admin users.
+
+Hashes are stored self-describing, so the algorithm and cost can change
+without a migration:
+
+    pbkdf2_sha256$<iterations>$<hex digest>
+    scrypt$<n>$<r>$<p>$<hex digest>
+
+Hashes from before this module are a bare SHA-256 of password + salt; they
+still verify, and verify() reports that they need rehashing so a successful
+login can replace them. Unless a cost is configured, it is calibrated once
+per process so one hash takes about the target latency on this machine.
+"""
+
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+
+ALGORITHMS = ('pbkdf2_sha256', 'scrypt')
+
+# Never go below these, however slow the machine is
+MIN_PBKDF2_ITERATIONS = 100000
+MIN_SCRYPT_N = 2 ** 14
+# 1 GB of memory per hash at r=8
+MAX_SCRYPT_N = 2 ** 20
+SCRYPT_R = 8
+SCRYPT_P = 1
+# Calibrated iteration counts are rounded down to this, so workers agree on the cost
+PBKDF2_STEP = 50000
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations).hex()
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'), n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=32).hex()
+
+
+def _legacy_sha256(password, salt):
+    return hashlib.sha256((password + salt).encode()).hexdigest()
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords with PBKDF2-SHA256 or scrypt at a tunable cost"""
+
+    def __init__(self, algorithm='pbkdf2_sha256', cost=None, target_seconds=0.1):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f'Unknown password hash algorithm: {algorithm}')
+        self.algorithm = algorithm
+        self.target_seconds = target_seconds
+        self._cost = cost
+        self._lock = threading.Lock()
+
+    @property
+    def cost(self):
+        """PBKDF2 iterations or scrypt N, calibrated on first use unless configured"""
+        if self._cost is None:
+            with self._lock:
+                if self._cost is None:
+                    self._cost = self.calibrate(self.target_seconds)
+        return self._cost
+
+    def calibrate(self, target_seconds):
+        """Largest cost whose hash takes no more than target_seconds here (but at least the minimum)"""
+        if self.algorithm == 'scrypt':
+            n = MIN_SCRYPT_N
+            while n < MAX_SCRYPT_N:
+                started = time.perf_counter()
+                _scrypt('calibrate', 'calibrate', n * 2, SCRYPT_R, SCRYPT_P)
+                if time.perf_counter() - started > target_seconds:
+                    return n
+                n *= 2
+            return n
+        sample = 20000
+        started = time.perf_counter()
+        _pbkdf2('calibrate', 'calibrate', sample)
+        per_iteration = (time.perf_counter() - started) / sample
+        iterations = int(target_seconds / per_iteration) // PBKDF2_STEP * PBKDF2_STEP
+        return max(iterations, MIN_PBKDF2_ITERATIONS)
+
+    def hash(self, password, salt=None):
+        """Returns (encoded hash, salt)"""
+        if salt is None:
+            salt = secrets.token_hex(32)
+        cost = self.cost
+        if self.algorithm == 'scrypt':
+            return f'scrypt${cost}${SCRYPT_R}${SCRYPT_P}${_scrypt(password, salt, cost, SCRYPT_R, SCRYPT_P)}', salt
+        return f'pbkdf2_sha256${cost}${_pbkdf2(password, salt, cost)}', salt
+
+    def verify(self, password, salt, encoded):
+        """Returns (matches, needs_rehash); the comparison takes the same time either way"""
+        parts = encoded.split('$')
+        try:
+            if parts[0] == 'pbkdf2_sha256' and len(parts) == 3:
+                cost = int(parts[1])
+                candidate = _pbkdf2(password, salt, cost)
+                stale = self.algorithm != 'pbkdf2_sha256' or cost < self.cost
+            elif parts[0] == 'scrypt' and len(parts) == 5:
+                cost, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+                candidate = _scrypt(password, salt, cost, r, p)
+                stale = self.algorithm != 'scrypt' or cost < self.cost
+            elif len(parts) == 1:
+                candidate = _legacy_sha256(password, salt)
+                stale = True
+            else:
+                return False, False
+        except ValueError:
+            return False, False
+        matches = hmac.compare_digest(candidate.encode(), parts[-1].encode())
+        return matches, matches and stale
+
+    def dummy_verify(self, password):
+        """Spend the same time as a real check, so unknown usernames don't answer faster"""
+        self.hash(password, 'dummy')
+
+
+def hasher_from_env():
+    """Build a PasswordHasher configured from PASSWORD_* environment variables"""
+    cost = os.environ.get('PASSWORD_HASH_COST')
+    return PasswordHasher(
+        algorithm=os.environ.get('PASSWORD_HASH_ALGORITHM', 'pbkdf2_sha256'),
+        cost=int(cost) if cost else None,
+        target_seconds=float(os.environ.get('PASSWORD_HASH_MS', 100)) / 1000.0
+    )
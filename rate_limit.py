@@ -0,0 +1,179 @@
+"""Token-bucket rate limiting for /login, shared by every gunicorn worker.
+
+Buckets live in a small memory-mapped file (in /dev/shm when it exists), so
+all workers on the host see the same counts without touching SQLite. Each
+login attempt takes one token from the client IP's bucket and one from the
+username's bucket; when either is empty the attempt is rejected before the
+database is queried or written.
+"""
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+import threading
+
+# Header: accepted, rejected_ip, rejected_username counters
+HEADER = struct.Struct('<QQQ')
+# Slot: key hash (0 = empty), tokens left, last refill (epoch seconds)
+SLOT = struct.Struct('<Qdd')
+# Slots probed for a key before the least recently used one is reused
+PROBE_LENGTH = 8
+
+
+class TokenBucketTable:
+    """Fixed-size open-addressing table of token buckets in a shared mmap file"""
+
+    def __init__(self, path, slots=4096):
+        self.path = path
+        self.slots = slots
+        self.size = HEADER.size + SLOT.size * slots
+        self._reset()
+
+    def _reset(self):
+        # Reopened after a fork so each worker has its own file description for flock
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        self._lock_file = open(self.path, 'rb')
+
+    def _locked(self):
+        if os.getpid() != self._pid:
+            self._reset()
+        return _TableLock(self._lock, self._lock_file)
+
+    def _key_hash(self, key):
+        value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value or 1
+
+    def _find(self, key_hash, now):
+        """Slot offset for key_hash, claiming an empty or the stalest probed slot if it's new"""
+        start = key_hash % self.slots
+        stalest = None
+        for probe in range(PROBE_LENGTH):
+            offset = HEADER.size + SLOT.size * ((start + probe) % self.slots)
+            slot_hash, tokens, updated = SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                return offset, tokens, updated
+            if slot_hash == 0:
+                return offset, None, now
+            if stalest is None or updated < stalest[1]:
+                stalest = (offset, updated)
+        return stalest[0], None, now
+
+    def take(self, buckets, now=None):
+        """Take one token from every (key, capacity, refill_per_second) bucket, or from none.
+
+        Returns (allowed, index of the first empty bucket or None, seconds until it has a token).
+        """
+        now = time.time() if now is None else now
+        with self._locked():
+            states = []
+            for index, (key, capacity, rate) in enumerate(buckets):
+                key_hash = self._key_hash(key)
+                offset, tokens, updated = self._find(key_hash, now)
+                if tokens is None:
+                    tokens = capacity
+                else:
+                    tokens = min(capacity, tokens + (now - updated) * rate)
+                states.append((offset, key_hash, tokens))
+                if tokens < 1:
+                    counter = 1 if index == 0 else 2
+                    self._count(counter)
+                    return False, index, (1 - tokens) / rate
+            for offset, key_hash, tokens in states:
+                SLOT.pack_into(self._map, offset, key_hash, tokens - 1, now)
+            self._count(0)
+            return True, None, 0
+
+    def refund(self, buckets, now=None):
+        """Give back a token, e.g. after a successful login"""
+        now = time.time() if now is None else now
+        with self._locked():
+            for key, capacity, rate in buckets:
+                key_hash = self._key_hash(key)
+                offset, tokens, updated = self._find(key_hash, now)
+                if tokens is not None:
+                    tokens = min(capacity, tokens + (now - updated) * rate + 1)
+                    SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+
+    def _count(self, index):
+        counters = list(HEADER.unpack_from(self._map, 0))
+        counters[index] += 1
+        HEADER.pack_into(self._map, 0, *counters)
+
+    def counters(self):
+        with self._locked():
+            return HEADER.unpack_from(self._map, 0)
+
+
+class _TableLock:
+    """Thread lock plus flock, since flock alone doesn't exclude threads sharing a descriptor"""
+
+    def __init__(self, thread_lock, lock_file):
+        self.thread_lock = thread_lock
+        self.lock_file = lock_file
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+
+class LoginRateLimiter:
+    """Per-IP and per-username token buckets for login attempts"""
+
+    def __init__(self, table, ip_capacity=10, ip_per_minute=10, user_capacity=5, user_per_minute=1):
+        self.table = table
+        self.ip_capacity = ip_capacity
+        self.ip_rate = ip_per_minute / 60.0
+        self.user_capacity = user_capacity
+        self.user_rate = user_per_minute / 60.0
+
+    def _buckets(self, ip_address, username):
+        return [
+            (f'ip:{ip_address}', self.ip_capacity, self.ip_rate),
+            (f'user:{username.lower()}', self.user_capacity, self.user_rate)
+        ]
+
+    def check(self, ip_address, username):
+        """Returns (allowed, retry_after_seconds) and uses up one attempt when allowed"""
+        allowed, _, wait = self.table.take(self._buckets(ip_address, username))
+        return allowed, int(wait) + 1 if not allowed else 0
+
+    def succeeded(self, ip_address, username):
+        """A correct password shouldn't count against the next login"""
+        self.table.refund(self._buckets(ip_address, username))
+
+    def get_stats(self):
+        accepted, rejected_ip, rejected_username = self.table.counters()
+        return {
+            'accepted': accepted,
+            'rejected_ip': rejected_ip,
+            'rejected_username': rejected_username
+        }
+
+
+def limiter_from_env():
+    """Build a LoginRateLimiter configured from LOGIN_* environment variables"""
+    shared_dir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    path = os.environ.get('LOGIN_RATE_LIMIT_FILE', os.path.join(shared_dir, 'bolder_electric_login_buckets'))
+    return LoginRateLimiter(
+        TokenBucketTable(path),
+        ip_capacity=int(os.environ.get('LOGIN_IP_BURST', 10)),
+        ip_per_minute=float(os.environ.get('LOGIN_IP_PER_MINUTE', 10)),
+        user_capacity=int(os.environ.get('LOGIN_USER_BURST', 5)),
+        user_per_minute=float(os.environ.get('LOGIN_USER_PER_MINUTE', 1))
+    )
@@ -0,0 +1,83 @@
+"""Fingerprinted URLs for files under static/.
+
+Every static file is hashed once at startup and url_for('static', ...) hands
+out names like css/style.3f9a1c2b7d4e.css. Those URLs change whenever the
+content does, so they are served with a one-year immutable Cache-Control;
+plain names keep working with a short max-age for anything that links to
+them directly.
+"""
+
+import os
+import re
+import hashlib
+import posixpath
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_MAX_AGE = 31536000
+# Unfingerprinted URLs (old links, robots.txt, search engines) revalidate after this long
+DEFAULT_MAX_AGE = 300
+
+# Gallery uploads appear at runtime and their derivatives are already named by SHA-256
+EXCLUDED_PREFIXES = ('images/gallery/',)
+CONTENT_ADDRESSED = re.compile(r'^images/gallery/[0-9a-f]{2}/[0-9a-f]{64}-')
+FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.[0-9a-f]{%d}(?P<extension>\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_name(filename, digest):
+    """Insert a content hash before the extension: css/style.css -> css/style.<hash>.css"""
+    stem, extension = posixpath.splitext(filename)
+    return f'{stem}.{digest[:FINGERPRINT_LENGTH]}{extension}'
+
+
+def build_asset_manifest(static_dir):
+    """Map every static file (relative, '/'-separated) to its fingerprinted name"""
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            # Precompressed .gz/.br siblings are served in place of their source file
+            if name.startswith('.') or name.endswith(('.tmp', '.gz', '.br')):
+                continue
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            if filename.startswith(EXCLUDED_PREFIXES):
+                continue
+            manifest[filename] = fingerprint_name(filename, file_digest(path))
+    return manifest
+
+
+class StaticAssets:
+    """Translates between static file names and their fingerprinted URLs"""
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.reload()
+
+    def reload(self):
+        """Re-hash the static folder, e.g. after derivatives were built"""
+        self.manifest = build_asset_manifest(self.static_dir)
+        self.originals = {fingerprinted: filename for filename, fingerprinted in self.manifest.items()}
+
+    def url_name(self, filename):
+        """Name to put in the URL for a static file (unchanged if it isn't in the manifest)"""
+        return self.manifest.get(filename, filename)
+
+    def resolve(self, filename):
+        """Map a requested name back to the file on disk and whether it can be cached forever"""
+        original = self.originals.get(filename)
+        if original is not None:
+            return original, True
+        match = FINGERPRINTED.match(filename)
+        if match and match.group('stem') + match.group('extension') in self.manifest:
+            # A page cached before the last deploy still gets the current file, just not forever
+            return match.group('stem') + match.group('extension'), False
+        return filename, bool(CONTENT_ADDRESSED.match(filename))